@@ -133,6 +133,46 @@ STATICFILES_DIRS = (Path(BASE_DIR, get_project_root_path("homebytwo/static")),)
 MEDIA_ROOT = get_env_variable("MEDIA_ROOT", get_project_root_path("homebytwo/media"))
 MEDIA_URL = get_env_variable("MEDIA_URL", "/media/")
 
+# File format of the DataFrames saved by DataFrameFields.
+# See homebytwo/routes/dataframe_backends.py for the available backends.
+
+DATAFRAME_BACKEND = get_env_variable(
+    "DATAFRAME_BACKEND", "homebytwo.routes.dataframe_backends.HDF5Backend"
+)
+
+# Compression codec of new DataFrame files, e.g. "zstd" or "lz4".
+# Leave empty to write uncompressed files.
+
+DATAFRAME_COMPRESSION = get_env_variable("DATAFRAME_COMPRESSION", "")
+
+# Maximum size in bytes of the DataFrames kept in memory by each process
+# after they have been read from storage. Set to 0 to disable the cache.
+
+DATAFRAME_CACHE_MAX_BYTES = int(
+    get_env_variable("DATAFRAME_CACHE_MAX_BYTES", str(64 * 1024 * 1024))
+)
+
+# Directory where the numerical DataFrame columns are saved as memory-mapped
+# NumPy files shared by all processes of the node, e.g. a folder in /dev/shm.
+# Leave empty to disable the shared columns.
+
+DATAFRAME_MMAP_ROOT = get_env_variable("DATAFRAME_MMAP_ROOT", "")
+
+# Local directory caching the DataFrame files read from storages without local
+# paths, e.g. S3-compatible object storages. Leave empty to disable the cache.
+
+DATAFRAME_STORAGE_CACHE_ROOT = get_env_variable("DATAFRAME_STORAGE_CACHE_ROOT", "")
+
+# Name DataFrame files after their content so that identical DataFrames,
+# e.g. the same route imported by several athletes, share a single file.
+
+DATAFRAME_CONTENT_ADDRESSED = bool(get_env_variable("DATAFRAME_CONTENT_ADDRESSED", ""))
+
+# Distance in m between the points of the elevation profiles resampled
+# from the track data, e.g. 10 or 25. Set to 0 to disable the profiles.
+
+TRACK_PROFILE_STEP = float(get_env_variable("TRACK_PROFILE_STEP", "0"))
+
 THUMBNAIL_ALIASES = {
     "": {
         "thumb": {"size": (90, 90), "crop": True, "sharpen": True},
@@ -149,6 +189,14 @@ celery_accept_content = ["application/json"]
 celery_result_serializer = "json"
 celery_task_serializer = "json"
 
+# route schedules saved after training prediction models can wait:
+# set a queue consumed by a low priority worker, e.g. `celery worker -Q schedules`
+celery_task_routes = {
+    "homebytwo.routes.tasks.save_route_schedules_task": {
+        "queue": get_env_variable("CELERY_SCHEDULES_QUEUE", "celery")
+    },
+}
+
 #############
 # Mailchimp #
 #############
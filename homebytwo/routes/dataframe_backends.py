@@ -0,0 +1,531 @@
+import json
+import os
+from fcntl import LOCK_EX, LOCK_SH, flock
+from functools import lru_cache
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+from threading import RLock
+from zlib import crc32
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+import pyarrow
+import tables
+from pandas import DataFrame, Index, read_hdf
+from pyarrow import feather, parquet
+
+# key of the DataFrames saved with `DataFrame.to_hdf` before columnar storage
+LEGACY_HDF5_KEY = "df"
+
+DEFAULT_DATAFRAME_BACKEND = "homebytwo.routes.dataframe_backends.HDF5Backend"
+
+CHECKSUM_CHUNK_SIZE = 1024 * 1024
+
+# compression level of the hdf5 files, from 0 to 9
+HDF5_COMPRESSION_LEVEL = 5
+
+# key of the DataFrame attrs in the schema metadata of Arrow files
+ARROW_ATTRS_KEY = b"homebytwo.attrs"
+
+
+def get_checksum_path(path):
+    """
+    return the path of the file holding the size and checksum of a DataFrame file.
+    The checksum file also serves as advisory lock for the DataFrame file.
+    """
+    return f"{path}.checksum"
+
+
+def get_file_checksum(path):
+    """
+    return the size and CRC32 checksum of a file as a string, e.g. "20480:3632233996"
+    """
+    size = checksum = 0
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(CHECKSUM_CHUNK_SIZE), b""):
+            size += len(chunk)
+            checksum = crc32(chunk, checksum)
+    return f"{size}:{checksum}"
+
+
+class DataFrameBackend:
+    """
+    read and write the DataFrames of DataFrameFields to files.
+
+    Backends must be able to read a subset of the columns of a file.
+    They raise FileNotFoundError if the file does not exist and IOError
+    if the file cannot be read, so that DataFrameField can handle both cases.
+
+    DataFrameFields use `save` and `load` which add crash and concurrency safety
+    to the `write` and `read` methods of the backends:
+    files are written to a temporary file and atomically renamed, their size is
+    verified on every read and their checksum on reads of all the columns, and
+    an advisory lock on the checksum file keeps readers from seeing a new file
+    with the checksum of the previous one.
+
+    New files are compressed with the codec set with the `compression` argument
+    or the `DATAFRAME_COMPRESSION` setting, e.g. "zstd" or "lz4".
+    Compressed files are read transparently, whatever the current setting.
+
+    The `attrs` of the DataFrame, e.g. the versions of its derived columns,
+    are saved to the file metadata and must be serializable to JSON.
+    """
+
+    # file extension of the files written by the backend
+    extension = None
+
+    # whether the backend writes to directories in the filesystem
+    uses_filesystem = True
+
+    # whether the backend reads a subset of the columns from seekable file objects,
+    # with `read_file`, without reading the complete file
+    reads_file_objects = False
+
+    def __init__(self, compression=None):
+        self._compression = compression
+
+    @property
+    def compression(self):
+        if self._compression is not None:
+            return self._compression
+        return getattr(settings, "DATAFRAME_COMPRESSION", "")
+
+    def write(self, dataframe, path):
+        raise NotImplementedError
+
+    def read(self, path, columns=None):
+        raise NotImplementedError
+
+    def save(self, dataframe, path):
+        """
+        write the DataFrame to a temporary file and rename it to the path
+        while holding an exclusive lock on the checksum file.
+        """
+        with NamedTemporaryFile(
+            dir=Path(path).parent, prefix=".", suffix=self.extension, delete=False
+        ) as temp_file:
+            temp_path = temp_file.name
+
+        try:
+            self.write(dataframe, temp_path)
+            checksum = get_file_checksum(temp_path)
+
+            # make sure the data is on disk before it replaces the previous file
+            with open(temp_path, "rb") as file:
+                os.fsync(file.fileno())
+
+            with open(get_checksum_path(path), "a+") as checksum_file:
+                flock(checksum_file.fileno(), LOCK_EX)
+                os.replace(temp_path, path)
+                checksum_file.seek(0)
+                checksum_file.truncate()
+                checksum_file.write(checksum)
+                checksum_file.flush()
+                os.fsync(checksum_file.fileno())
+
+        finally:
+            if Path(temp_path).exists():
+                Path(temp_path).unlink()
+
+    def load(self, path, columns=None, version=None):
+        """
+        read the DataFrame while holding a shared lock on the checksum file,
+        after verifying the size of the file. The checksum is only verified
+        when all the columns are read: reading a few columns does not read
+        the complete file.
+
+        Files saved without checksum are read without verification.
+
+        :param version: version of the file from `get_version`, if known
+        """
+        try:
+            checksum_file = open(get_checksum_path(path), "r")
+        except FileNotFoundError:
+            return self.read(path, columns)
+
+        with checksum_file:
+            flock(checksum_file.fileno(), LOCK_SH)
+            expected_checksum = checksum_file.read()
+            if expected_checksum:
+                expected_size, _ = expected_checksum.split(":")
+                if int(expected_size) != Path(path).stat().st_size or (
+                    columns is None and expected_checksum != get_file_checksum(path)
+                ):
+                    raise IOError(f"Checksum mismatch for DataFrame file {path}.")
+
+            return self.read(path, columns)
+
+    def exists(self, path):
+        return Path(path).exists()
+
+    def touch(self, path):
+        Path(path).touch(exist_ok=True)
+
+    def delete(self, path):
+        Path(path).unlink()
+
+        checksum_path = Path(get_checksum_path(path))
+        if checksum_path.exists():
+            checksum_path.unlink()
+
+    def get_version(self, path):
+        """
+        return a value that changes whenever the file is written
+        """
+        stat = Path(path).stat()
+        return stat.st_mtime_ns, stat.st_size
+
+    def get_modified_time(self, path):
+        """
+        return the modification time of the file as a timestamp
+        """
+        return Path(path).stat().st_mtime
+
+
+def write_hdf5_array(hdf5_file, name, values, filters=None):
+    """
+    write a NumPy array to the root of an open hdf5 file.
+
+    numerical and boolean values are saved as plain arrays, or chunked arrays
+    if the values are compressed with `filters`.
+    Strings and other python objects are pickled.
+    """
+    if values.dtype.kind in "biuf":
+        if filters is not None and values.size:
+            hdf5_file.create_carray("/", name, obj=values, filters=filters)
+        else:
+            hdf5_file.create_array("/", name, values)
+    else:
+        hdf5_file.create_vlarray(
+            "/", name, tables.ObjectAtom(), filters=filters
+        ).append(values)
+
+
+def read_hdf5_array(node):
+    """
+    read a NumPy array saved with `write_hdf5_array`.
+    """
+    if isinstance(node, tables.VLArray):
+        return node.read()[0]
+    return node.read()
+
+
+def write_hdf5_columns(dataframe, path, filters=None):
+    """
+    write every column of the DataFrame to a separate array of an hdf5 file,
+    so that columns can be read independently of each other.
+    """
+    with tables.open_file(path, mode="w") as hdf5_file:
+        write_hdf5_array(hdf5_file, "index", dataframe.index.to_numpy(), filters)
+        for position, column in enumerate(dataframe.columns):
+            write_hdf5_array(
+                hdf5_file, f"column_{position}", dataframe[column].to_numpy(), filters
+            )
+        hdf5_file.root._v_attrs.columns = list(dataframe.columns)
+        hdf5_file.root._v_attrs.dataframe_attrs = json.dumps(dataframe.attrs)
+
+
+def read_hdf5_columns(path, columns=None):
+    """
+    read the requested columns from an hdf5 file written with `write_hdf5_columns`.
+
+    Files saved in the legacy `fixed` format are read completely
+    before the columns are selected.
+
+    :param path: absolute path of the hdf5 file
+    :param columns: list of column names, all columns are read if `None`
+    :raises KeyError: if a requested column is not in the file
+    """
+    if not Path(path).exists():
+        raise FileNotFoundError(f"File {path} does not exist")
+
+    with tables.open_file(path, mode="r") as hdf5_file:
+        is_legacy = f"/{LEGACY_HDF5_KEY}" in hdf5_file
+
+        if not is_legacy:
+            try:
+                stored_columns = list(hdf5_file.root._v_attrs.columns)
+            except AttributeError:
+                raise IOError(f"No DataFrame columns found in {path}.")
+
+            columns = stored_columns if columns is None else list(columns)
+            missing_columns = [col for col in columns if col not in stored_columns]
+            if missing_columns:
+                raise KeyError(f"{missing_columns} not in stored columns.")
+
+            try:
+                index = read_hdf5_array(hdf5_file.root.index)
+                data = {
+                    column: read_hdf5_array(
+                        hdf5_file.get_node(
+                            "/", f"column_{stored_columns.index(column)}"
+                        )
+                    )
+                    for column in columns
+                }
+            except tables.NoSuchNodeError as error:
+                raise IOError(f"Incomplete DataFrame file {path}: {error}")
+
+            dataframe = DataFrame(data, index=Index(index), columns=columns)
+            if "dataframe_attrs" in hdf5_file.root._v_attrs:
+                dataframe.attrs = json.loads(hdf5_file.root._v_attrs.dataframe_attrs)
+            return dataframe
+
+    dataframe = read_hdf(path, LEGACY_HDF5_KEY)
+    return dataframe if columns is None else dataframe[list(columns)]
+
+
+class HDF5Backend(DataFrameBackend):
+    """
+    one PyTables array per column, see `write_hdf5_columns`.
+
+    PyTables is not thread-safe: hdf5 files are read and written one at a time
+    in each process.
+    """
+
+    extension = ".h5"
+    lock = RLock()
+
+    def get_filters(self):
+        """
+        return the PyTables filters for the compression codec, e.g.
+        "zlib" or "blosc:zstd". Codecs without library use Blosc, e.g. "zstd".
+        """
+        if not self.compression:
+            return None
+
+        complib = self.compression
+        if complib not in tables.filters.all_complibs:
+            complib = f"blosc:{complib}"
+
+        return tables.Filters(
+            complevel=HDF5_COMPRESSION_LEVEL, complib=complib, shuffle=True
+        )
+
+    def write(self, dataframe, path):
+        with self.lock:
+            write_hdf5_columns(dataframe, path, self.get_filters())
+
+    def read(self, path, columns=None):
+        try:
+            with self.lock:
+                return read_hdf5_columns(path, columns)
+        except tables.HDF5ExtError as error:
+            raise IOError(error)
+
+
+class ArrowBackend(DataFrameBackend):
+    """
+    base class for the file formats written with Apache Arrow.
+
+    The DataFrame index is stored as a column and always read with the
+    requested columns. Object columns must hold strings or `None`.
+    """
+
+    # codec used if no compression is set
+    default_compression = None
+
+    def get_compression(self):
+        """
+        return the Arrow codec for the compression setting, e.g. "zstd"
+        for "blosc:zstd".
+        """
+        compression = self.compression or self.default_compression
+        if compression:
+            return compression.split(":")[-1]
+
+    def write_table(self, table, path):
+        raise NotImplementedError
+
+    def read_table(self, source, columns):
+        raise NotImplementedError
+
+    def read_schema(self, source):
+        raise NotImplementedError
+
+    def write(self, dataframe, path):
+        table = pyarrow.Table.from_pandas(dataframe, preserve_index=True)
+        table = table.replace_schema_metadata(
+            {
+                **(table.schema.metadata or {}),
+                ARROW_ATTRS_KEY: json.dumps(dataframe.attrs).encode(),
+            }
+        )
+        self.write_table(table, path)
+
+    def read(self, path, columns=None):
+        if not Path(path).exists():
+            raise FileNotFoundError(f"File {path} does not exist")
+
+        return self.read_file(path, columns)
+
+    def read_file(self, source, columns=None):
+        """
+        read the columns from a path or a seekable file object
+        """
+        try:
+            if columns is not None:
+                schema = self.read_schema(source)
+                pandas_metadata = schema.pandas_metadata or {}
+                index_columns = [
+                    column
+                    for column in pandas_metadata.get("index_columns", [])
+                    if isinstance(column, str)
+                ]
+                missing_columns = [
+                    column for column in columns if column not in schema.names
+                ]
+                if missing_columns:
+                    raise KeyError(f"{missing_columns} not in stored columns.")
+                columns = list(columns) + index_columns
+                if hasattr(source, "seek"):
+                    source.seek(0)
+            table = self.read_table(source, columns)
+            dataframe = table.to_pandas()
+            attrs = (table.schema.metadata or {}).get(ARROW_ATTRS_KEY)
+            if attrs:
+                dataframe.attrs = json.loads(attrs)
+            return dataframe
+        except pyarrow.ArrowException as error:
+            raise IOError(error)
+
+
+class FeatherBackend(ArrowBackend):
+    """
+    Feather V2 files, i.e. the Arrow IPC format on disk.
+    Files are uncompressed unless "lz4" or "zstd" compression is set.
+    """
+
+    extension = ".feather"
+    default_compression = "uncompressed"
+
+    def write_table(self, table, path):
+        feather.write_feather(table, path, compression=self.get_compression())
+
+    def read_table(self, source, columns):
+        memory_map = isinstance(source, str)
+        return feather.read_table(source, columns=columns, memory_map=memory_map)
+
+    def read_schema(self, source):
+        if isinstance(source, str):
+            with pyarrow.memory_map(source) as file:
+                return pyarrow.ipc.open_file(file).schema
+        return pyarrow.ipc.open_file(source).schema
+
+
+class ParquetBackend(ArrowBackend):
+    """
+    Parquet files, snappy-compressed unless another compression is set:
+    smaller but slower to decode than Feather.
+    """
+
+    extension = ".parquet"
+    default_compression = "snappy"
+
+    # only the metadata and the column chunks of the requested columns are read
+    reads_file_objects = True
+
+    def write_table(self, table, path):
+        parquet.write_table(table, path, compression=self.get_compression())
+
+    def read_table(self, source, columns):
+        return parquet.read_table(source, columns=columns, use_pandas_metadata=False)
+
+    def read_schema(self, source):
+        return parquet.read_schema(source)
+
+
+class MemoryBackend(DataFrameBackend):
+    """
+    keep DataFrames in a dictionary of the backend instance instead of files.
+
+    Useful for tests that should not touch the disk.
+    """
+
+    extension = ".mem"
+    uses_filesystem = False
+
+    def __init__(self, compression=None):
+        super().__init__(compression)
+        self.files = {}
+
+    def write(self, dataframe, path):
+        self.files[path] = dataframe.copy()
+
+    def read(self, path, columns=None):
+        try:
+            dataframe = self.files[path]
+        except KeyError:
+            raise FileNotFoundError(f"File {path} does not exist")
+        columns = dataframe.columns if columns is None else list(columns)
+        return dataframe[columns].copy()
+
+    def save(self, dataframe, path):
+        self.write(dataframe, path)
+
+    def load(self, path, columns=None, version=None):
+        return self.read(path, columns)
+
+    def exists(self, path):
+        return path in self.files
+
+    def touch(self, path):
+        pass
+
+    def get_version(self, path):
+        try:
+            return id(self.files[path])
+        except KeyError:
+            raise FileNotFoundError(f"File {path} does not exist")
+
+    def get_modified_time(self, path):
+        return None
+
+    def delete(self, path):
+        try:
+            del self.files[path]
+        except KeyError:
+            raise FileNotFoundError(f"File {path} does not exist")
+
+
+BACKEND_CLASSES = [HDF5Backend, FeatherBackend, ParquetBackend, MemoryBackend]
+
+
+@lru_cache(maxsize=None)
+def load_backend(import_path):
+    try:
+        backend_class = import_string(import_path)
+    except ImportError as error:
+        raise ImproperlyConfigured(f"Invalid DataFrame backend: {error}")
+
+    return backend_class()
+
+
+def get_backend(import_path=None):
+    """
+    return an instance of the DataFrame backend class at the import path.
+    The `DATAFRAME_BACKEND` setting is used if no import path is given.
+    """
+    return load_backend(
+        import_path
+        or getattr(settings, "DATAFRAME_BACKEND", DEFAULT_DATAFRAME_BACKEND)
+    )
+
+
+def get_backend_for_path(path, default=None):
+    """
+    return the backend able to read a file based on its extension.
+
+    :param path: path of the DataFrame file
+    :param default: backend returned for unknown extensions
+    """
+    suffix = Path(path).suffix
+    for backend_class in BACKEND_CLASSES:
+        if backend_class.extension == suffix:
+            return get_backend(
+                f"{backend_class.__module__}.{backend_class.__qualname__}"
+            )
+
+    return default
@@ -0,0 +1,116 @@
+from collections import OrderedDict
+from threading import Lock
+
+from django.conf import settings
+
+DEFAULT_DATAFRAME_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+
+class DataFrameCache:
+    """
+    process-local LRU cache of the DataFrames read by DataFrameFields.
+
+    Entries are keyed by the absolute path of the file and only returned
+    while the file version, e.g. modification time and size, is unchanged.
+    Entries built from column-projected reads are marked incomplete and
+    only returned for the columns they hold.
+    The cache holds at most `DATAFRAME_CACHE_MAX_BYTES` of DataFrames,
+    the least recently used entries are evicted first.
+
+    Cached DataFrames are never handed out: `get` returns copies so that callers
+    can add or modify columns without changing the cache.
+    """
+
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = Lock()
+
+    @property
+    def max_bytes(self):
+        return getattr(
+            settings, "DATAFRAME_CACHE_MAX_BYTES", DEFAULT_DATAFRAME_CACHE_MAX_BYTES
+        )
+
+    def get(self, path, version, columns=None):
+        """
+        return a copy of the cached DataFrame or `None` if the requested columns
+        of this version of the file are not in the cache. All columns, i.e.
+        `columns=None`, are only returned if the complete file was read.
+        """
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is None:
+                return None
+
+            entry_version, dataframe, _, complete = entry
+            if entry_version != version:
+                self._remove(path)
+                return None
+
+            if columns is None:
+                if not complete:
+                    return None
+            else:
+                if not all(column in dataframe.columns for column in columns):
+                    return None
+                dataframe = dataframe[list(columns)]
+
+            self.entries.move_to_end(path)
+            return dataframe.copy()
+
+    def set(self, path, version, dataframe, complete=True):
+        """
+        add the DataFrame read from a version of the file to the cache.
+
+        Columns read separately from the same version of the file
+        are added to the existing entry.
+
+        :param complete: whether the DataFrame holds all the columns of the file
+        """
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is not None and entry[0] == version:
+                cached_dataframe = entry[1]
+                new_columns = [
+                    column
+                    for column in dataframe.columns
+                    if column not in cached_dataframe.columns
+                ]
+                dataframe = cached_dataframe.join(dataframe[new_columns])
+                dataframe.attrs = cached_dataframe.attrs
+                complete = complete or entry[3]
+            else:
+                dataframe = dataframe.copy()
+
+            size = int(dataframe.memory_usage(deep=True).sum())
+            self._remove(path)
+
+            if size > self.max_bytes:
+                return
+
+            self.entries[path] = (version, dataframe, size, complete)
+            self.size += size
+
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+
+    def invalidate(self, path):
+        """
+        remove the DataFrame of a file from the cache, e.g. after writing the file.
+        """
+        with self.lock:
+            self._remove(path)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def _remove(self, path):
+        entry = self.entries.pop(path, None)
+        if entry is not None:
+            self.size -= entry[2]
+
+
+dataframe_cache = DataFrameCache()
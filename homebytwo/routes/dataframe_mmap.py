@@ -0,0 +1,95 @@
+import logging
+import os
+import shutil
+from hashlib import sha1
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+from urllib.parse import quote
+
+from django.conf import settings
+
+from numpy import load, save
+
+logger = logging.getLogger(__name__)
+
+
+class SharedColumns:
+    """
+    read-only memory-mapped copies of the numerical columns of DataFrame files.
+
+    Each column is saved once to a NumPy `.npy` file under `DATAFRAME_MMAP_ROOT`,
+    in a directory per version of the DataFrame file, for example:
+    <DATAFRAME_MMAP_ROOT>/<hash of the file path>/<hash of the version>/altitude.npy
+
+    Every process on the node maps the same files, so the pages are shared
+    through the page cache instead of being decoded by every gunicorn worker and
+    celery child. Leaving the setting empty disables the shared columns.
+    """
+
+    @property
+    def root(self):
+        return getattr(settings, "DATAFRAME_MMAP_ROOT", "")
+
+    @property
+    def enabled(self):
+        return bool(self.root)
+
+    def get_directory(self, path, version=None):
+        directory = Path(self.root, sha1(str(path).encode()).hexdigest())
+        if version is None:
+            return directory
+        return directory / sha1(str(version).encode()).hexdigest()
+
+    @staticmethod
+    def get_filename(column):
+        return quote(str(column), safe="") + ".npy"
+
+    def get(self, path, version, columns):
+        """
+        return a dict of read-only memory-mapped arrays for the requested columns
+        or `None` if any of the columns are not available for this file version.
+        """
+        directory = self.get_directory(path, version)
+        try:
+            return {
+                column: load(directory / self.get_filename(column), mmap_mode="r")
+                for column in columns
+            }
+        except (OSError, ValueError):
+            return None
+
+    def set(self, path, version, dataframe):
+        """
+        save the numerical columns of the DataFrame for this version of the file
+        and remove the columns saved for the previous versions.
+        """
+        directory = self.get_directory(path, version)
+        try:
+            directory.mkdir(parents=True, exist_ok=True)
+            for column in dataframe.columns:
+                values = dataframe[column].to_numpy()
+                filepath = directory / self.get_filename(column)
+                if values.dtype.kind not in "biuf" or filepath.exists():
+                    continue
+
+                # write to a temporary file first so that no process maps half a file
+                with NamedTemporaryFile(dir=directory, delete=False) as temp_file:
+                    save(temp_file, values)
+                os.replace(temp_file.name, filepath)
+
+            for previous_version in directory.parent.iterdir():
+                if previous_version != directory:
+                    shutil.rmtree(previous_version, ignore_errors=True)
+
+        except OSError as error:
+            logger.warning(f"Could not save shared DataFrame columns: {error}")
+
+    def invalidate(self, path):
+        """
+        remove the columns of all versions of the file
+        """
+        if self.enabled:
+            shutil.rmtree(self.get_directory(path), ignore_errors=True)
+
+
+shared_columns = SharedColumns()
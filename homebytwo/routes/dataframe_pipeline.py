@@ -0,0 +1,98 @@
+# key of the stage versions in the DataFrame attrs, saved to the file metadata
+VERSIONS_ATTR = "versions"
+
+# version of the columns saved before versions were recorded in the file metadata
+LEGACY_VERSION = 1
+
+
+class DerivedColumns:
+    """
+    stage of a `DataFramePipeline`: columns calculated from other columns.
+
+    Increment the `version` whenever the calculation changes, so that
+    the columns saved with a previous version are calculated again.
+
+    :param name: name of the stage
+    :param columns: columns calculated by the stage
+    :param version: version of the calculation
+    :param depends_on: names of the stages that must be calculated first
+    """
+
+    def __init__(self, name, columns, version=LEGACY_VERSION, depends_on=None):
+        self.name = name
+        self.columns = list(columns)
+        self.version = version
+        self.depends_on = list(depends_on or [])
+
+    def __repr__(self):
+        return "<DerivedColumns: {} v{}>".format(self.name, self.version)
+
+
+class DataFramePipeline:
+    """
+    registry of the derived columns of a DataFrame, in the order they are calculated.
+
+    The versions of the stages are kept in the `attrs` of the DataFrame,
+    which DataFrameFields save to the file metadata. Only the stages with missing
+    columns or an outdated version are calculated again, with the stages
+    depending on them.
+    """
+
+    def __init__(self, *stages):
+        names = set()
+        for stage in stages:
+            missing_stages = [name for name in stage.depends_on if name not in names]
+            if missing_stages:
+                raise ValueError(
+                    f"Stage {stage.name} depends on {missing_stages}, "
+                    "which are not calculated before it."
+                )
+            names.add(stage.name)
+
+        self.stages = list(stages)
+
+    def get_versions(self, dataframe):
+        """
+        return the versions of the stages saved with the DataFrame
+        """
+        return dict(dataframe.attrs.get(VERSIONS_ATTR, {}))
+
+    def get_stored_version(self, dataframe, stage):
+        """
+        return the version of the stage columns in the DataFrame
+        or `None` if any of the columns is missing.
+        """
+        if not all(column in dataframe.columns for column in stage.columns):
+            return None
+        return self.get_versions(dataframe).get(stage.name, LEGACY_VERSION)
+
+    def get_stale_stages(self, dataframe, force=False):
+        """
+        return the stages to calculate, in order.
+
+        :param dataframe: DataFrame with the columns saved to storage
+        :param force: return all stages, whatever the stored versions
+        """
+        stale_stages = []
+        stale_names = set()
+
+        for stage in self.stages:
+            if (
+                force
+                or self.get_stored_version(dataframe, stage) != stage.version
+                or any(name in stale_names for name in stage.depends_on)
+            ):
+                stale_stages.append(stage)
+                stale_names.add(stage.name)
+
+        return stale_stages
+
+    def set_versions(self, dataframe, stages):
+        """
+        record the versions of the calculated stages in the DataFrame attrs.
+        """
+        # replace the versions: attrs are only shallow-copied with DataFrames
+        dataframe.attrs[VERSIONS_ATTR] = {
+            **self.get_versions(dataframe),
+            **{stage.name: stage.version for stage in stages},
+        }
@@ -0,0 +1,227 @@
+import os
+import shutil
+from hashlib import sha1
+from pathlib import Path
+from tempfile import NamedTemporaryFile, TemporaryDirectory
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured, SuspiciousFileOperation
+from django.core.files import File
+from django.core.files.base import ContentFile
+
+# smaller files are downloaded completely, even if only some columns are read:
+# range reads of the metadata and of the columns cost more requests and bytes.
+RANGE_READ_MIN_SIZE = 1024 * 1024
+
+
+def is_local_storage(storage):
+    """
+    whether the files of a Django storage are accessible with local paths
+    """
+    try:
+        storage.path("")
+    except NotImplementedError:
+        return False
+    return True
+
+
+def get_storage_name(value):
+    """
+    return the name of a file in a storage without local paths,
+    refusing the names that could escape the storage location.
+    """
+    name = Path(value)
+    if name.is_absolute() or ".." in name.parts:
+        raise SuspiciousFileOperation(f"Invalid DataFrame file name: {value}.")
+    return name.as_posix()
+
+
+def get_touch_name(name):
+    """
+    return the name of the empty file saved when a storage file is touched
+    """
+    return f"{name}.touch"
+
+
+class StorageBackend:
+    """
+    read and write the DataFrame files of a backend in a Django storage
+    without local paths, e.g. an S3-compatible object storage.
+
+    Files are written to a temporary file and uploaded in one request.
+    Files are downloaded to a local read-through cache under
+    `DATAFRAME_STORAGE_CACHE_ROOT`, in a directory per version of the file:
+    <DATAFRAME_STORAGE_CACHE_ROOT>/<hash of the name>/<hash of the version>.h5
+
+    Backends that can read file objects, e.g. Parquet, read the requested
+    columns of large files that are not in the local cache with the seeks and
+    byte-range reads of the storage files, instead of downloading them.
+    Leaving the setting empty disables the local cache.
+    """
+
+    uses_filesystem = False
+
+    def __init__(self, backend, storage):
+        self.backend = backend
+        self.storage = storage
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, StorageBackend)
+            and self.backend is other.backend
+            and self.storage is other.storage
+        )
+
+    def __hash__(self):
+        return hash((self.backend, self.storage))
+
+    @property
+    def extension(self):
+        return self.backend.extension
+
+    @property
+    def cache_root(self):
+        return getattr(settings, "DATAFRAME_STORAGE_CACHE_ROOT", "")
+
+    def get_cache_path(self, name, version):
+        directory = Path(self.cache_root, sha1(name.encode()).hexdigest())
+        filename = sha1(str(version).encode()).hexdigest() + self.extension
+        return directory / filename
+
+    def save(self, dataframe, name):
+        with TemporaryDirectory() as directory:
+            path = Path(directory, Path(name).name).as_posix()
+            self.backend.write(dataframe, path)
+            with open(path, "rb") as file:
+                self.upload(name, File(file))
+
+            if self.cache_root:
+                self.add_to_cache(name, self.get_version(name), path)
+
+    def upload(self, name, file):
+        """
+        save the file to storage, overwriting the existing file with the same name
+        in one request, so that readers never find the file missing.
+
+        Storages saving new files under another name instead of overwriting them
+        are refused: deleting the existing file first would let readers
+        find it missing until the new file is saved.
+        """
+        if self.storage.exists(name) and (
+            self.storage.get_available_name(name) != name
+        ):
+            raise ImproperlyConfigured(
+                f"The storage of DataFrame file {name} does not overwrite files, "
+                "e.g. set AWS_S3_FILE_OVERWRITE to True."
+            )
+
+        saved_name = self.storage.save(name, file)
+        if saved_name != name:
+            self.storage.delete(saved_name)
+            raise IOError(f"DataFrame file {name} was saved as {saved_name}.")
+
+    def load(self, name, columns=None, version=None):
+        """
+        read the DataFrame from the local cache or from storage.
+
+        :param version: version of the file from `get_version`, if known,
+        to save the requests of reading it again from storage
+        """
+        if version is None:
+            version = self.get_version(name)
+
+        if self.cache_root:
+            cache_path = self.get_cache_path(name, version)
+            if cache_path.exists():
+                return self.backend.read(cache_path.as_posix(), columns)
+
+        # byte-range reads of the columns, without downloading the whole file
+        _, size = version
+        if (
+            columns is not None
+            and self.backend.reads_file_objects
+            and size >= RANGE_READ_MIN_SIZE
+        ):
+            with self.storage.open(name, "rb") as file:
+                return self.backend.read_file(file, columns)
+
+        with TemporaryDirectory() as directory:
+            path = Path(directory, Path(name).name).as_posix()
+            with self.storage.open(name, "rb") as file, open(path, "wb") as copy:
+                shutil.copyfileobj(file, copy)
+
+            if self.cache_root:
+                self.add_to_cache(name, version, path)
+            return self.backend.read(path, columns)
+
+    def add_to_cache(self, name, version, path):
+        """
+        copy the file of this version to the local cache
+        and remove the copies of the previous versions.
+        """
+        cache_path = self.get_cache_path(name, version)
+        try:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+
+            # copy to a temporary file first so that no process reads half a file
+            with NamedTemporaryFile(dir=cache_path.parent, delete=False) as temp_file:
+                with open(path, "rb") as file:
+                    shutil.copyfileobj(file, temp_file)
+            os.replace(temp_file.name, cache_path)
+
+            for previous_version in cache_path.parent.iterdir():
+                if previous_version != cache_path:
+                    previous_version.unlink()
+
+        except OSError:
+            # the cache is an optimization: files are read from storage instead
+            pass
+
+    def remove_from_cache(self, name):
+        if self.cache_root:
+            shutil.rmtree(
+                Path(self.cache_root, sha1(name.encode()).hexdigest()),
+                ignore_errors=True,
+            )
+
+    def exists(self, name):
+        return self.storage.exists(name)
+
+    def delete(self, name):
+        if not self.storage.exists(name):
+            raise FileNotFoundError(f"File {name} does not exist")
+        self.storage.delete(name)
+        self.remove_from_cache(name)
+
+        touch_name = get_touch_name(name)
+        if self.storage.exists(touch_name):
+            self.storage.delete(touch_name)
+
+    def touch(self, name):
+        """
+        storage files cannot be touched: save an empty file next to the file
+        instead, whose modification time counts as the modification time of
+        the file, see `get_modified_time`. The file itself is not transferred.
+        """
+        if not self.storage.exists(name):
+            raise FileNotFoundError(f"File {name} does not exist")
+        self.upload(get_touch_name(name), ContentFile(b""))
+
+    def get_version(self, name):
+        if not self.storage.exists(name):
+            raise FileNotFoundError(f"File {name} does not exist")
+        return self.storage.get_modified_time(name), self.storage.size(name)
+
+    def get_modified_time(self, name):
+        """
+        return the modification time of the file as a timestamp,
+        or the time it was last touched if it is more recent.
+        """
+        modified_time = self.storage.get_modified_time(name).timestamp()
+
+        touch_name = get_touch_name(name)
+        if self.storage.exists(touch_name):
+            touched_time = self.storage.get_modified_time(touch_name).timestamp()
+            modified_time = max(modified_time, touched_time)
+
+        return modified_time
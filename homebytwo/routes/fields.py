@@ -1,8 +1,14 @@
+import json
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, partialmethod
+from hashlib import sha1
 from inspect import getmro
 from pathlib import Path
+from time import time
 
 from django.apps import apps
+from django.conf import settings
 from django.contrib.gis.db import models
 from django.contrib.gis.geos import GEOSGeometry
 from django.contrib.postgres.fields import ArrayField
@@ -10,15 +16,32 @@ from django.core import checks
 from django.core.exceptions import FieldDoesNotExist, ValidationError
 from django.core.files.storage import default_storage
 from django.db import connection as db_connection
+from django.db import transaction
 from django.forms import MultipleChoiceField
 from django.forms.widgets import CheckboxSelectMultiple
 from django.utils.translation import gettext_lazy as _
 
 from numpy import array
-from pandas import DataFrame, read_hdf
+from pandas import DataFrame
+from pandas.util import hash_pandas_object
+
+from .dataframe_backends import get_backend, get_backend_for_path
+from .dataframe_cache import dataframe_cache
+from .dataframe_mmap import shared_columns
+from .dataframe_storage import StorageBackend, get_storage_name, is_local_storage
 
 logger = logging.getLogger(__name__)
 
+# directory of the DataFrame files named after their content
+CONTENT_ADDRESSED_DIRECTORY = "dataframes"
+
+# unreferenced content-addressed files modified more recently are kept,
+# they may have just been reused by a transaction that is not committed yet.
+UNREFERENCED_FILE_GRACE_PERIOD = 60
+
+# number of threads reading DataFrame files in `prefetch_dataframes`
+DEFAULT_PREFETCH_WORKERS = 8
+
 
 def LineSubstring(line, start_location, end_location):
     """
@@ -44,14 +67,211 @@ def LineSubstring(line, start_location, end_location):
     return GEOSGeometry(geom)
 
 
+def get_dataframe_hash(dataframe):
+    """
+    return a hash of the DataFrame values, index, column names, dtypes and attrs
+    or `None` if the DataFrame holds values that cannot be hashed.
+    """
+    try:
+        row_hashes = hash_pandas_object(dataframe, index=True).to_numpy()
+        # attrs are saved to the file metadata, e.g. the versions of derived columns
+        attrs = json.dumps(dataframe.attrs, sort_keys=True) if dataframe.attrs else ""
+    except TypeError:
+        return None
+
+    content_hash = sha1(row_hashes.tobytes())
+    content_hash.update(repr(dataframe.dtypes.to_dict()).encode())
+    content_hash.update(attrs.encode())
+    return content_hash.hexdigest()
+
+
+def downcast_dataframe(dataframe, dtypes):
+    """
+    return the DataFrame with its columns cast to compact dtypes,
+    e.g. {"altitude": "float32", "time": "int32", "moving": "bool"}.
+
+    Floats are cast at the cost of precision. Integer and boolean columns that
+    would lose values, e.g. because of missing values, are kept as they are.
+    The DataFrame is returned unchanged if no column needs to be cast.
+    """
+    compact_columns = {}
+    for column, dtype in dtypes.items():
+        if column not in dataframe.columns or dataframe[column].dtype == dtype:
+            continue
+
+        values = dataframe[column]
+        try:
+            compact_values = values.astype(dtype)
+        except (TypeError, ValueError):
+            continue
+
+        if compact_values.dtype.kind in "biu" and not (compact_values == values).all():
+            continue
+
+        compact_columns[column] = compact_values
+
+    if not compact_columns:
+        return dataframe
+
+    return dataframe.assign(**compact_columns)
+
+
+def get_dataframe_fields():
+    """
+    return the DataFrameFields of all concrete models as tuples (model, field)
+    """
+    return [
+        (model, field)
+        for model in apps.get_models()
+        if not model._meta.proxy
+        for field in model._meta.get_fields()
+        if isinstance(field, DataFrameField)
+    ]
+
+
+def count_dataframe_references(filepath):
+    """
+    return the number of database rows referencing a DataFrame file
+    """
+    return sum(
+        model._base_manager.filter(**{field.attname: filepath}).count()
+        for model, field in get_dataframe_fields()
+    )
+
+
+def load_dataframe(instance, field, columns=None):
+    """
+    return the DataFrame of a DataFrameField restricted to the requested columns.
+
+    Added to models as `load_<field name>`, e.g. `route.load_data(columns=[...])`.
+    """
+    return field.load_dataframe(instance, columns)
+
+
+def load_arrays(instance, columns, field):
+    """
+    return the requested columns of a DataFrameField as a dict of NumPy arrays.
+
+    Added to models as `load_<field name>_arrays`,
+    e.g. `route.load_data_arrays(["distance", "altitude"])`.
+    """
+    return field.load_arrays(instance, columns)
+
+
+def prefetch_dataframes(
+    instances, field_names, columns=None, workers=DEFAULT_PREFETCH_WORKERS
+):
+    """
+    read the DataFrame files of model instances with a pool of threads
+    and attach the DataFrames to the instances.
+
+    File reads and decompression mostly release the GIL, so batch jobs
+    keep several reads in flight instead of waiting on each file in turn.
+
+    :param instances: model instances loaded from the database
+    :param field_names: names of the DataFrameFields to read
+    :param columns: read only these columns, as with `load_<field name>`
+    :param workers: maximum number of threads reading files
+    """
+    tasks = [
+        (instance, instance._meta.get_field(field_name))
+        for instance in instances
+        for field_name in field_names
+    ]
+
+    # only read placeholders: deferred fields would query the database
+    tasks = [
+        (instance, field)
+        for instance, field in tasks
+        if isinstance(instance.__dict__.get(field.attname), DataFrameFile)
+    ]
+    if not tasks:
+        return
+
+    def prefetch(task):
+        instance, field = task
+        if columns is None:
+            getattr(instance, field.attname)
+        else:
+            field.load_dataframe(instance, columns)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(prefetch, tasks))
+
+
+class DataFrameFile:
+    """
+    placeholder for a DataFrame that has not been read from storage yet.
+
+    Model instances loaded from the database only keep the relative filepath
+    of their DataFrame. The file is read the first time the attribute is accessed.
+    Columns read on their own with `DataFrameField.load_dataframe` are kept
+    in `columns` for later use.
+    """
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.columns = {}
+
+    def __repr__(self):
+        return "<DataFrameFile: {}>".format(self.filepath)
+
+
+class DataFrameDescriptor:
+    """
+    read the DataFrame from storage on first access and
+    keep it on the model instance for later use.
+
+    modelled after Django's `FileDescriptor`.
+    """
+
+    def __init__(self, field):
+        self.field = field
+
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+
+        # the field was deferred: retrieve the filepath from the database
+        if self.field.attname not in instance.__dict__:
+            instance.refresh_from_db(fields=[self.field.attname])
+
+        value = instance.__dict__[self.field.attname]
+
+        # read the file and replace the placeholder with the DataFrame
+        if isinstance(value, DataFrameFile):
+            self.field.set_stored_filepath(instance, value.filepath)
+            value = self.field.retrieve_dataframe(value.filepath)
+            instance.__dict__[self.field.attname] = value
+
+        return value
+
+    def __set__(self, instance, value):
+        instance.__dict__[self.field.attname] = value
+
+
 class DataFrameField(models.CharField):
     """
-    custom field to save Pandas DataFrame to the hdf5 file format
-    as advised in the official pandas documentation:
-    http://pandas.pydata.org/pandas-docs/stable/io.html#io-perf
+    custom field to save Pandas DataFrame to files in storage.
+
+    The file format is handled by a backend from `dataframe_backends`, set with
+    the `backend` option or the `DATAFRAME_BACKEND` setting. New files are
+    written with that backend, existing files are read and written with
+    the backend matching their extension.
+
+    Files are saved with the `storage` of the field, by default the storage
+    of the media files. Storages without local paths, e.g. S3-compatible object
+    storages, are supported through `dataframe_storage.StorageBackend`.
+
+    The `dtypes` option maps column names to compact dtypes, e.g. float32
+    instead of float64, that the columns are cast to before they are written.
+
+    DataFrames are read lazily: loading a model instance from the database
+    does not touch the file until the field attribute is accessed.
     """
 
     attr_class = DataFrame
+    descriptor_class = DataFrameDescriptor
 
     default_error_messages = {
         "invalid": _("Please provide a DataFrame object"),
@@ -64,12 +284,18 @@ class DataFrameField(models.CharField):
         upload_to="data",
         storage=None,
         unique_fields=None,
+        backend=None,
+        content_addressed=None,
+        dtypes=None,
         **kwargs,
     ):
 
         self.storage = storage or default_storage
         self.upload_to = upload_to
         self.unique_fields = unique_fields
+        self.backend = backend
+        self.content_addressed = content_addressed
+        self.dtypes = dtypes
 
         kwargs.setdefault("max_length", 100)
         super().__init__(verbose_name, name, **kwargs)
@@ -103,6 +329,18 @@ class DataFrameField(models.CharField):
                 ]
         return []
 
+    def contribute_to_class(self, cls, name, **kwargs):
+        super().contribute_to_class(cls, name, **kwargs)
+        setattr(cls, self.attname, self.descriptor_class(self))
+        self.stored_filepath_attname = "_%s_stored_filepath" % self.attname
+        load_methods = {
+            "load_%s" % self.name: load_dataframe,
+            "load_%s_arrays" % self.name: load_arrays,
+        }
+        for method_name, method in load_methods.items():
+            if method_name not in cls.__dict__:
+                setattr(cls, method_name, partialmethod(method, field=self))
+
     def deconstruct(self):
         name, path, args, kwargs = super().deconstruct()
         if kwargs.get("max_length") == 100:
@@ -112,62 +350,199 @@ class DataFrameField(models.CharField):
         if self.storage is not default_storage:
             kwargs["storage"] = self.storage
         kwargs["unique_fields"] = self.unique_fields
+        if self.backend:
+            kwargs["backend"] = self.backend
+        if self.content_addressed is not None:
+            kwargs["content_addressed"] = self.content_addressed
+        if self.dtypes:
+            kwargs["dtypes"] = self.dtypes
         return name, path, args, kwargs
 
+    @property
+    def is_content_addressed(self):
+        """
+        whether files are named after their content instead of the unique fields,
+        set with the `content_addressed` option or DATAFRAME_CONTENT_ADDRESSED.
+        """
+        if self.content_addressed is not None:
+            return self.content_addressed
+        return getattr(settings, "DATAFRAME_CONTENT_ADDRESSED", False)
+
     def from_db_value(self, value, expression, connection):
         """
-        return a DataFrame object from the filepath saved in DB
+        return a placeholder for the DataFrame saved at the filepath in the DB.
+
+        The file is only read when the attribute is accessed, see DataFrameDescriptor.
         """
         if value is None:
             return value
 
-        return self.retrieve_dataframe(value)
+        # make sure the filepath is valid in storage without reading the file
+        self.get_absolute_path(value)
+
+        return DataFrameFile(value)
 
     def get_absolute_path(self, value):
         """
         return absolute path based on the value saved in the Database.
+
+        Storages without local paths use the name of the file in the storage.
         """
+        if not is_local_storage(self.storage):
+            return get_storage_name(value)
 
         return self.storage.path(value)
 
-    def retrieve_dataframe(self, value):
+    def get_backend(self, path=None):
+        """
+        return the backend of the field or the backend matching the file extension.
+        """
+        backend = get_backend(self.backend)
+        if path is not None:
+            backend = get_backend_for_path(path, default=backend)
+        return self.wrap_backend(backend)
+
+    def wrap_backend(self, backend):
+        """
+        return a backend reading and writing files in the storage of the field.
+        """
+        if is_local_storage(self.storage) or not backend.uses_filesystem:
+            return backend
+        return StorageBackend(backend, self.storage)
+
+    def retrieve_dataframe(self, value, columns=None, version=None):
         """
         return the pandas DataFrame and add filepath as property to Dataframe
+
+        :param value: relative filepath saved in the database
+        :param columns: only read these columns from the file, all columns if `None`
+        :param version: version of the file from `backend.get_version`, if known
         """
 
         # read dataframe from storage
         absolute_filepath = self.get_absolute_path(value)
 
-        # HaCkY as F* for migration 0044 and 0046.
-        # We can remove it once deployed.
-        if not Path(absolute_filepath).exists():
-            *dirs, filename = Path(value).parts
-            old_path = Path(*dirs, "data", filename).as_posix()
-            absolute_filepath = self.get_absolute_path(old_path)
+        backend = self.get_backend(absolute_filepath)
 
         try:
-            dataframe = read_hdf(absolute_filepath)
+            if version is None:
+                try:
+                    version = backend.get_version(absolute_filepath)
+
+                # HaCkY as F* for migration 0044 and 0046.
+                # We can remove it once deployed.
+                except FileNotFoundError:
+                    *dirs, filename = Path(value).parts
+                    old_path = Path(*dirs, "data", filename).as_posix()
+                    absolute_filepath = self.get_absolute_path(old_path)
+                    version = backend.get_version(absolute_filepath)
+
+            dataframe = dataframe_cache.get(absolute_filepath, version, columns)
+            if dataframe is None:
+                dataframe = backend.load(absolute_filepath, columns, version=version)
+                dataframe_cache.set(
+                    absolute_filepath, version, dataframe, complete=columns is None
+                )
 
         # if the file has been deleted return None
         except FileNotFoundError:
             logger.error("DataFrame file was deleted from the media folder.")
             return None
 
-        # if the file is corrupted, delete it and return None
+        # if the file is corrupted return None, it will be replaced on the next save.
+        # Leave the file in place for inspection: it may still be recoverable.
         except IOError:
-            logger.error("DataFrame file could not be read from the media folder.")
-            Path(absolute_filepath).unlink()
+            logger.error(
+                "DataFrame file could not be read from the media folder.",
+                exc_info=True,
+            )
+            dataframe_cache.invalidate(absolute_filepath)
+            shared_columns.invalidate(absolute_filepath)
             return None
 
         # add relative filepath as instance property for later use
         dataframe.filepath = value
 
+        # remember the content of complete DataFrames to skip saving them unchanged
+        if columns is None:
+            dataframe.content_hash = get_dataframe_hash(dataframe)
+
         return dataframe
 
+    def load_dataframe(self, model_instance, columns=None, version=None):
+        """
+        return the DataFrame of the model instance restricted to the requested columns.
+
+        If the DataFrame has already been read or set on the instance,
+        the columns are selected in memory. Otherwise, only the missing columns
+        are read from storage and kept on the DataFrameFile placeholder.
+
+        :param version: version of the file from `backend.get_version`, if known
+        """
+        value = model_instance.__dict__.get(self.attname)
+
+        if columns is None or not isinstance(value, DataFrameFile):
+            dataframe = getattr(model_instance, self.attname)
+            if dataframe is None or columns is None:
+                return dataframe
+            return dataframe[list(columns)].copy()
+
+        missing_columns = [column for column in columns if column not in value.columns]
+        if missing_columns:
+            dataframe = self.retrieve_dataframe(
+                value.filepath, missing_columns, version
+            )
+            if dataframe is None:
+                return None
+            value.columns.update(dataframe.items())
+
+        return DataFrame({column: value.columns[column] for column in columns})
+
+    def load_arrays(self, model_instance, columns):
+        """
+        return the requested columns of the model instance DataFrame as NumPy arrays.
+
+        When `DATAFRAME_MMAP_ROOT` is set and the DataFrame has not been read
+        on the instance, the numerical columns are returned as read-only arrays
+        memory-mapped from files shared by all processes, see `SharedColumns`.
+        """
+        value = model_instance.__dict__.get(self.attname)
+
+        if isinstance(value, DataFrameFile) and shared_columns.enabled:
+            absolute_filepath = self.get_absolute_path(value.filepath)
+            backend = self.get_backend(absolute_filepath)
+            try:
+                version = backend.get_version(absolute_filepath)
+            except FileNotFoundError:
+                version = None
+
+            if version is not None:
+                arrays = shared_columns.get(absolute_filepath, version, columns)
+                if arrays is not None:
+                    return arrays
+
+                dataframe = self.load_dataframe(model_instance, columns, version)
+                if dataframe is None:
+                    return None
+
+                shared_columns.set(absolute_filepath, version, dataframe)
+                return {column: dataframe[column].to_numpy() for column in columns}
+
+        dataframe = self.load_dataframe(model_instance, columns)
+        if dataframe is None:
+            return None
+
+        return {column: dataframe[column].to_numpy() for column in columns}
+
     def pre_save(self, model_instance, add):
         """
         save the dataframe field to an hdf5 field before saving the model
         """
+        # the DataFrame was never read from storage: there is nothing to write
+        value = model_instance.__dict__.get(self.attname)
+        if isinstance(value, DataFrameFile):
+            return value
+
         dataframe = super().pre_save(model_instance, add)
 
         if dataframe is None:
@@ -179,6 +554,17 @@ class DataFrameField(models.CharField):
                 code="invalid",
             )
 
+        # keep the instance in sync with the compact values saved to the file
+        if self.dtypes:
+            compact_dataframe = downcast_dataframe(dataframe, self.dtypes)
+            if compact_dataframe is not dataframe:
+                # the copy must still be compared to the file it was read from
+                for attr in ["filepath", "content_hash"]:
+                    if hasattr(dataframe, attr):
+                        setattr(compact_dataframe, attr, getattr(dataframe, attr))
+                dataframe = compact_dataframe
+                setattr(model_instance, self.attname, dataframe)
+
         self.save_dataframe_to_file(dataframe, model_instance)
 
         return dataframe
@@ -191,18 +577,181 @@ class DataFrameField(models.CharField):
             return value
 
         # save only the filepath to the database
+        if isinstance(value, DataFrameFile):
+            return value.filepath
+
+        # filepath used in a lookup
+        if isinstance(value, str):
+            return value
+
         if value.filepath:
             return value.filepath
 
+    def has_changed(self, model_instance):
+        """
+        whether the DataFrame of the model instance has been set or changed
+        since it was read from storage or saved, without reading it from storage.
+        """
+        value = model_instance.__dict__.get(self.attname)
+        if value is None:
+            return self.get_stored_filepath(model_instance) is not None
+
+        if isinstance(value, DataFrame):
+            content_hash = getattr(value, "content_hash", None)
+            return (
+                content_hash is None
+                or getattr(value, "filepath", None)
+                != self.get_stored_filepath(model_instance)
+                or get_dataframe_hash(value) != content_hash
+            )
+
+        return False
+
+    def get_version(self, model_instance):
+        """
+        return the filepath and the version of the file holding the DataFrame
+        of the model instance, without reading it from storage.
+
+        Return `None` if there is no file or if the DataFrame has been
+        changed on the instance since it was read or saved.
+        """
+        value = model_instance.__dict__.get(self.attname)
+        if value is None or self.has_changed(model_instance):
+            return None
+
+        absolute_filepath = self.get_absolute_path(value.filepath)
+        backend = self.get_backend(absolute_filepath)
+        try:
+            return value.filepath, backend.get_version(absolute_filepath)
+        except FileNotFoundError:
+            return None
+
+    def get_stored_filepath(self, model_instance):
+        """
+        return the filepath of the file holding the DataFrame of the model instance,
+        i.e. the file it was read from or last written to.
+        """
+        return model_instance.__dict__.get(self.stored_filepath_attname)
+
+    def set_stored_filepath(self, model_instance, filepath):
+        model_instance.__dict__[self.stored_filepath_attname] = filepath
+
     def save_dataframe_to_file(self, dataframe, model_instance):
         """
-        write the Dataframe into an hdf5 file in storage at filepath
+        write the Dataframe to a file in storage at filepath
+        """
+        content_hash = get_dataframe_hash(dataframe)
+        if self.is_content_addressed and content_hash is not None:
+            return self.save_content_addressed_dataframe(
+                dataframe, content_hash, model_instance
+            )
+
+        stored_filepath = self.get_stored_filepath(model_instance)
+        dataframe.filepath = self.generate_filepath(model_instance)
+
+        # keep the file format of DataFrames read from storage
+        if stored_filepath and get_backend_for_path(stored_filepath):
+            dataframe.filepath = (
+                Path(dataframe.filepath)
+                .with_suffix(Path(stored_filepath).suffix)
+                .as_posix()
+            )
+
+        full_filepath = self.get_absolute_path(dataframe.filepath)
+        backend = self.get_backend(full_filepath)
+
+        # skip writing DataFrames that have not changed since they were read
+        if (
+            content_hash is not None
+            and content_hash == getattr(dataframe, "content_hash", None)
+            and stored_filepath == dataframe.filepath
+            and backend.exists(full_filepath)
+        ):
+            return
+
+        if backend.uses_filesystem:
+            self.create_directory(full_filepath)
+
+        # save to storage
+        dataframe_cache.invalidate(full_filepath)
+        shared_columns.invalidate(full_filepath)
+        backend.save(dataframe, full_filepath)
+        dataframe.content_hash = content_hash
+        self.set_stored_filepath(model_instance, dataframe.filepath)
+
+    def save_content_addressed_dataframe(
+        self, dataframe, content_hash, model_instance
+    ):
+        """
+        save the DataFrame to a file named after its content hash.
+
+        Identical DataFrames, e.g. the same route imported by several athletes,
+        share a single file: only their filepath is saved to the database.
+        The file previously used by the instance is deleted after the transaction
+        is committed, if no other row references it.
+        """
+        previous_filepath = self.get_stored_filepath(model_instance)
+        dataframe.filepath = self.get_content_addressed_filepath(content_hash)
+
+        full_filepath = self.get_absolute_path(dataframe.filepath)
+        backend = self.get_backend(full_filepath)
+
+        if not backend.exists(full_filepath):
+            if backend.uses_filesystem:
+                self.create_directory(full_filepath)
+            backend.save(dataframe, full_filepath)
+
+        elif previous_filepath != dataframe.filepath:
+            # keep the reused file from being collected as unreferenced
+            backend.touch(full_filepath)
+
+        dataframe.content_hash = content_hash
+        self.set_stored_filepath(model_instance, dataframe.filepath)
+
+        if previous_filepath and previous_filepath != dataframe.filepath:
+            transaction.on_commit(
+                partial(self.delete_unreferenced_file, previous_filepath)
+            )
+
+    def get_content_addressed_filepath(self, content_hash, backend=None):
+        """
+        return the filepath of a DataFrame based on its content hash,
+        e.g. dataframes/3f/3f786850e387550fdab836ed7e6dc881de23001b.h5
+        """
+        backend = backend or self.get_backend()
+        return Path(
+            CONTENT_ADDRESSED_DIRECTORY,
+            content_hash[:2],
+            content_hash + backend.extension,
+        ).as_posix()
+
+    def delete_unreferenced_file(self, filepath):
         """
-        # try to retrieve the filepath set when loading from the database
-        if not dataframe.get("filepath"):
-            dataframe.filepath = self.generate_filepath(model_instance)
+        delete a DataFrame file that is not referenced by any database row
+        and was not modified during the grace period.
+        """
+        if count_dataframe_references(filepath):
+            return
 
-        full_filepath = self.storage.path(dataframe.filepath)
+        full_filepath = self.get_absolute_path(filepath)
+        backend = self.get_backend(full_filepath)
+        try:
+            modified_time = backend.get_modified_time(full_filepath)
+            if (
+                modified_time is not None
+                and time() - modified_time < UNREFERENCED_FILE_GRACE_PERIOD
+            ):
+                return
+            dataframe_cache.invalidate(full_filepath)
+            shared_columns.invalidate(full_filepath)
+            backend.delete(full_filepath)
+        except FileNotFoundError:
+            pass
+
+    def create_directory(self, full_filepath):
+        """
+        create the directory of the DataFrame file and its parents if required
+        """
 
         # Create any intermediate directories that do not exist.
         directory = Path(full_filepath).parent
@@ -220,9 +769,6 @@ class DataFrameField(models.CharField):
             else:
                 directory.mkdir(parents=True, exist_ok=True)
 
-        # save to storage
-        dataframe.to_hdf(full_filepath, "df", mode="w", format="fixed")
-
     def generate_filepath(self, instance):
         """
         return a filepath based on the model's class name
@@ -247,10 +793,11 @@ class DataFrameField(models.CharField):
             )
 
         # filename, for example: route_data_<uuid>.h5
-        filename = "{class_name}_{field_name}_{unique_id}.h5".format(
+        filename = "{class_name}_{field_name}_{unique_id}{extension}".format(
             class_name=class_name.lower(),
             field_name=self.name,
             unique_id="".join(unique_id_values),
+            extension=self.get_backend().extension,
         )
 
         # generate filepath
@@ -262,6 +809,53 @@ class DataFrameField(models.CharField):
         return self.storage.generate_filename(filepath)
 
 
+class DataFrameQuerySetMixin:
+    """
+    add `prefetch_dataframes` to the querysets of models with DataFrameFields,
+    e.g. `Activity.objects.prefetch_dataframes("streams", workers=8)`.
+
+    Like `prefetch_related`, the DataFrames are read when the queryset
+    is evaluated. Querysets consumed with `iterator()` are not prefetched.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._dataframe_prefetch = None
+        self._dataframes_prefetched = False
+
+    def prefetch_dataframes(
+        self, *field_names, columns=None, workers=DEFAULT_PREFETCH_WORKERS
+    ):
+        """
+        read the DataFrame files of the instances with a pool of threads,
+        see `prefetch_dataframes`.
+        """
+        for field_name in field_names:
+            if not isinstance(self.model._meta.get_field(field_name), DataFrameField):
+                raise ValueError(f"{field_name} is not a DataFrameField.")
+
+        clone = self._chain()
+        clone._dataframe_prefetch = (field_names, columns, workers)
+        return clone
+
+    def _clone(self):
+        clone = super()._clone()
+        clone._dataframe_prefetch = self._dataframe_prefetch
+        return clone
+
+    def _fetch_all(self):
+        super()._fetch_all()
+        if self._dataframe_prefetch and not self._dataframes_prefetched:
+            field_names, columns, workers = self._dataframe_prefetch
+            instances = [
+                instance
+                for instance in self._result_cache
+                if isinstance(instance, models.Model)
+            ]
+            prefetch_dataframes(instances, field_names, columns, workers)
+            self._dataframes_prefetched = True
+
+
 class NumpyArrayField(ArrayField):
     """
     Save NumPy arrays to PostgreSQl ArrayFields.
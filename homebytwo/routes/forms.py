@@ -208,3 +208,15 @@ class ActivityPerformanceForm(Form):
             self.fields["workout_type"] = ChoiceField(
                 choices=workout_type_choices, required=False
             )
+
+    def get_initial_options(self):
+        """
+        return the gear and the workout type selected when the form is displayed
+        """
+        gear = self.fields["gear"].choices[0][0] if "gear" in self.fields else None
+        workout_type = (
+            self.fields["workout_type"].choices[0][0]
+            if "workout_type" in self.fields
+            else None
+        )
+        return gear, workout_type
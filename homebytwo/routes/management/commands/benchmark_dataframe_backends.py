@@ -0,0 +1,108 @@
+from pathlib import Path
+from statistics import mean
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...dataframe_backends import BACKEND_CLASSES
+from ...models import Activity, Route
+
+
+def time_call(function, *args, repeat=1, **kwargs):
+    """
+    return the best time in milliseconds out of `repeat` calls to the function.
+    """
+    timings = []
+    for _ in range(repeat):
+        start = perf_counter()
+        function(*args, **kwargs)
+        timings.append((perf_counter() - start) * 1000)
+    return min(timings)
+
+
+class Command(BaseCommand):
+    help = "Compare DataFrame backends on the route data and activity streams"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--limit",
+            type=int,
+            default=20,
+            help="number of routes and of activities to use, defaults to 20.",
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=5,
+            help="number of timed calls per operation, the best one is kept.",
+        )
+
+    def handle(self, *args, **options):
+        samples = {
+            "route data": [
+                route.data
+                for route in Route.objects.exclude(data__isnull=True)[
+                    : options["limit"]
+                ]
+            ],
+            "activity streams": [
+                activity.streams
+                for activity in Activity.objects.exclude(streams__isnull=True)[
+                    : options["limit"]
+                ]
+            ],
+        }
+
+        header = "{:<18} {:<16} {:>10} {:>10} {:>12} {:>10}".format(
+            "sample", "backend", "write ms", "read ms", "2 cols ms", "size kB"
+        )
+        self.stdout.write(header)
+
+        for sample_name, dataframes in samples.items():
+            dataframes = [df for df in dataframes if df is not None]
+            if not dataframes:
+                self.stdout.write(f"No {sample_name} to benchmark.")
+                continue
+
+            for backend_class in BACKEND_CLASSES:
+                backend = backend_class()
+                if not backend.uses_filesystem:
+                    continue
+                try:
+                    result = self.benchmark(backend, dataframes, options["repeat"])
+                except Exception as error:
+                    raise CommandError(f"{backend_class.__name__} failed: {error}")
+
+                self.stdout.write(
+                    "{:<18} {:<16} {:>10.2f} {:>10.2f} {:>12.2f} {:>10.1f}".format(
+                        sample_name, backend_class.__name__, *result
+                    )
+                )
+
+    def benchmark(self, backend, dataframes, repeat):
+        """
+        return mean write time, full read time, two-column read time and file size
+        """
+        write_times, read_times, column_read_times, sizes = [], [], [], []
+
+        with TemporaryDirectory() as directory:
+            for position, dataframe in enumerate(dataframes):
+                path = Path(directory, f"{position}{backend.extension}").as_posix()
+                columns = list(dataframe.columns[:2])
+
+                write_times.append(
+                    time_call(backend.save, dataframe, path, repeat=repeat)
+                )
+                read_times.append(time_call(backend.load, path, repeat=repeat))
+                column_read_times.append(
+                    time_call(backend.load, path, columns, repeat=repeat)
+                )
+                sizes.append(Path(path).stat().st_size / 1024)
+
+        return (
+            mean(write_times),
+            mean(read_times),
+            mean(column_read_times),
+            mean(sizes),
+        )
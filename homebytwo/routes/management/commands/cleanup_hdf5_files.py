@@ -5,11 +5,13 @@ from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
 from django.db import connection
 
+from ...dataframe_backends import BACKEND_CLASSES, get_backend, get_backend_for_path
+from ...dataframe_storage import is_local_storage
 from ...fields import DataFrameField
 
 
 class Command(BaseCommand):
-    help = "Clean up unused HDF5 files from the media folder"
+    help = "Clean up unused DataFrame files from the media folder"
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -71,7 +73,8 @@ class Command(BaseCommand):
         db_file_list = []
 
         for model, field in dataframe_fields:
-            if field.column:
+            # only the files in the media folder are cleaned up
+            if field.column and is_local_storage(field.storage):
                 query = "SELECT {column} FROM {db_table}".format(
                     column=field.column,
                     db_table=model._meta.db_table,
@@ -89,10 +92,15 @@ class Command(BaseCommand):
 
     def list_os_files(self):
         """
-        list all .h5 files in the media folders.
+        list all DataFrame files in the media folders, e.g. .h5 files.
         """
         media_folder = Path(settings.MEDIA_ROOT)
-        return {path.resolve().as_posix() for path in media_folder.glob("**/*.h5")}
+        return {
+            path.resolve().as_posix()
+            for backend_class in BACKEND_CLASSES
+            if backend_class.uses_filesystem
+            for path in media_folder.glob(f"**/*{backend_class.extension}")
+        }
 
     def delete_files(self, files_to_delete):
         """
@@ -100,7 +108,7 @@ class Command(BaseCommand):
         """
         for file in files_to_delete:
             try:
-                Path(file).unlink()
+                get_backend_for_path(file, default=get_backend()).delete(file)
             except OSError as error:
                 raise CommandError("{} could not be deleted: {}".format(file, error))
 
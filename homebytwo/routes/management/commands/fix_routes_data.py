@@ -34,10 +34,10 @@ class Command(BaseCommand):
             message = "Fixing routes with mismatching coordinates and altitude data..."
             self.stdout.write(message)
 
-        for route in Route.objects.all():
+        for route in Route.objects.prefetch_dataframes("data", columns=["distance"]):
 
             # discard routes with matching geom and data
-            if len(route.geom) == len(route.data.distance):
+            if len(route.geom) == len(route.load_data(columns=["distance"])):
                 continue
 
             # try to get data from source
@@ -0,0 +1,116 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from ...dataframe_backends import get_backend
+from ...fields import (
+    CONTENT_ADDRESSED_DIRECTORY,
+    DataFrameFile,
+    count_dataframe_references,
+    get_dataframe_fields,
+    get_dataframe_hash,
+)
+
+
+class Command(BaseCommand):
+    help = "Convert the files saved by DataFrameFields to another DataFrame backend"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--backend",
+            default=None,
+            help="import path of the target backend, defaults to DATAFRAME_BACKEND.",
+        )
+        parser.add_argument(
+            "--content-addressed",
+            action="store_true",
+            default=False,
+            help="move files to the content-addressed layout, merging duplicates.",
+        )
+        parser.add_argument(
+            "--rewrite",
+            action="store_true",
+            default=False,
+            help="also rewrite files already saved with the target backend.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            "--dryrun",
+            action="store_false",
+            dest="migrate",
+            default=True,
+            help="list files that would be converted, without converting them.",
+        )
+
+    def handle(self, *args, **options):
+        content_addressed = options["content_addressed"]
+        migrated_count = skipped_count = error_count = 0
+
+        for model, field in get_dataframe_fields():
+            target_backend = field.wrap_backend(get_backend(options["backend"]))
+            rows = model.objects.exclude(**{f"{field.attname}__isnull": True})
+            for pk, value in rows.values_list("pk", field.attname):
+                source_path = field.get_absolute_path(value.filepath)
+                source_backend = field.get_backend(source_path)
+                is_content_addressed = (
+                    Path(value.filepath).parts[0] == CONTENT_ADDRESSED_DIRECTORY
+                )
+
+                if (
+                    source_backend == target_backend
+                    and not options["rewrite"]
+                    and (is_content_addressed or not content_addressed)
+                ):
+                    skipped_count += 1
+                    continue
+
+                if not options["migrate"]:
+                    self.stdout.write(f"{source_path}")
+                    migrated_count += 1
+                    continue
+
+                try:
+                    dataframe = source_backend.load(source_path)
+                except (FileNotFoundError, IOError) as error:
+                    self.stderr.write(f"{source_path} could not be read: {error}")
+                    error_count += 1
+                    continue
+
+                content_hash = get_dataframe_hash(dataframe)
+                if content_addressed and content_hash is not None:
+                    filepath = field.get_content_addressed_filepath(
+                        content_hash, target_backend
+                    )
+                else:
+                    filepath = Path(value.filepath)
+                    filepath = filepath.with_suffix(target_backend.extension)
+                    filepath = filepath.as_posix()
+                target_path = field.get_absolute_path(filepath)
+
+                # identical content has already been migrated for another row
+                reuse_file = (
+                    content_addressed
+                    and target_path != source_path
+                    and target_backend.exists(target_path)
+                )
+                if not reuse_file:
+                    if target_backend.uses_filesystem:
+                        field.create_directory(target_path)
+                    target_backend.save(dataframe, target_path)
+
+                model.objects.filter(pk=pk).update(
+                    **{field.attname: DataFrameFile(filepath)}
+                )
+                if target_path != source_path and not count_dataframe_references(
+                    value.filepath
+                ):
+                    source_backend.delete(source_path)
+
+                migrated_count += 1
+
+        action = "Converted" if options["migrate"] else "Would convert"
+        message = f"{action} {migrated_count} files and skipped {skipped_count}."
+        self.stdout.write(self.style.SUCCESS(message))
+
+        if error_count:
+            self.stdout.write(f"{error_count} file(s) could not be read.")
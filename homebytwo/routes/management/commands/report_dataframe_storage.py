@@ -0,0 +1,122 @@
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from django.core.management.base import BaseCommand
+
+from ...dataframe_backends import get_backend
+from ...fields import downcast_dataframe, get_dataframe_fields
+from .benchmark_dataframe_backends import time_call
+
+
+class Command(BaseCommand):
+    help = (
+        "Report the disk savings and read times of compressed DataFrame files "
+        "with compact dtypes compared to the files in the media folder"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--compression",
+            default="zstd",
+            help="compression codec to compare with, defaults to zstd.",
+        )
+        parser.add_argument(
+            "--backend",
+            default=None,
+            help="import path of the backend to compare with, "
+            "defaults to DATAFRAME_BACKEND.",
+        )
+        parser.add_argument(
+            "--limit",
+            type=int,
+            default=None,
+            help="maximum number of files per DataFrameField, defaults to all files.",
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=1,
+            help="number of timed reads per file, the best one is kept.",
+        )
+
+    def handle(self, *args, **options):
+        target_backend = get_backend(options["backend"]).__class__(
+            compression=options["compression"]
+        )
+
+        header = "{:<18} {:>7} {:>10} {:>10} {:>8} {:>9} {:>9}".format(
+            "field", "files", "size MB", "new MB", "saved", "read ms", "new ms"
+        )
+        self.stdout.write(header)
+
+        for model, field in get_dataframe_fields():
+            label = f"{model.__name__}.{field.name}"
+            rows = model.objects.exclude(**{f"{field.attname}__isnull": True})
+            filepaths = rows.values_list(field.attname, flat=True)
+            if options["limit"] is not None:
+                filepaths = filepaths[: options["limit"]]
+
+            result = self.compare_files(
+                field,
+                [value.filepath for value in filepaths],
+                target_backend,
+                options["repeat"],
+            )
+            file_count, size, new_size, read_time, new_read_time, errors = result
+
+            if not file_count:
+                self.stdout.write(f"No files found for {label}.")
+                continue
+
+            savings = 1 - new_size / size if size else 0
+            self.stdout.write(
+                "{:<18} {:>7} {:>10.2f} {:>10.2f} {:>8.1%} {:>9.2f} {:>9.2f}".format(
+                    label,
+                    file_count,
+                    size / 1024 ** 2,
+                    new_size / 1024 ** 2,
+                    savings,
+                    read_time / file_count,
+                    new_read_time / file_count,
+                )
+            )
+            if errors:
+                self.stdout.write(f"{errors} file(s) of {label} could not be read.")
+
+    def compare_files(self, field, filepaths, target_backend, repeat):
+        """
+        read every file and write it again with compact dtypes and compression.
+
+        return the number of files compared, their total size in bytes before and
+        after, their total read time in milliseconds before and after,
+        and the number of files that could not be read.
+        """
+        file_count = size = new_size = read_time = new_read_time = errors = 0
+
+        with TemporaryDirectory() as directory:
+            for filepath in filepaths:
+                path = field.get_absolute_path(filepath)
+                backend = field.get_backend(path)
+                if not backend.uses_filesystem:
+                    continue
+
+                try:
+                    dataframe = backend.load(path)
+                    read_time += time_call(backend.load, path, repeat=repeat)
+                except (FileNotFoundError, IOError):
+                    errors += 1
+                    continue
+
+                new_path = Path(directory, f"dataframe{target_backend.extension}")
+                new_path = new_path.as_posix()
+                dataframe = downcast_dataframe(dataframe, field.dtypes or {})
+                target_backend.save(dataframe, new_path)
+                new_read_time += time_call(
+                    target_backend.load, new_path, repeat=repeat
+                )
+
+                size += Path(path).stat().st_size
+                new_size += Path(new_path).stat().st_size
+                file_count += 1
+
+        return file_count, size, new_size, read_time, new_read_time, errors
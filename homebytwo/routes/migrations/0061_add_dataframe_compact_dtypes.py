@@ -0,0 +1,44 @@
+# Generated by Django 2.2.17 on 2026-10-18 05:43
+
+from django.db import migrations
+
+import homebytwo.routes.fields
+import homebytwo.routes.models.activity
+import homebytwo.routes.models.track
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("routes", "0060_adapt_coef_data_for_activity_types"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="activity",
+            name="streams",
+            field=homebytwo.routes.fields.DataFrameField(
+                dtypes={
+                    "altitude": "float32",
+                    "moving": "bool",
+                    "time": "int32",
+                },
+                null=True,
+                unique_fields=["strava_id"],
+                upload_to=homebytwo.routes.models.activity.athlete_streams_directory_path,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="route",
+            name="data",
+            field=homebytwo.routes.fields.DataFrameField(
+                dtypes={
+                    "altitude": "float32",
+                    "gradient": "float32",
+                },
+                null=True,
+                unique_fields=["uuid"],
+                upload_to=homebytwo.routes.models.track.athlete_data_directory_path,
+            ),
+        ),
+    ]
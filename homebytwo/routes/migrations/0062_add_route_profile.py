@@ -0,0 +1,26 @@
+# Generated by Django 2.2.17 on 2026-10-18 06:02
+
+from django.db import migrations
+
+import homebytwo.routes.fields
+import homebytwo.routes.models.track
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("routes", "0061_add_dataframe_compact_dtypes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="route",
+            name="profile",
+            field=homebytwo.routes.fields.DataFrameField(
+                dtypes={"altitude": "float32"},
+                null=True,
+                unique_fields=["uuid"],
+                upload_to=homebytwo.routes.models.track.athlete_data_directory_path,
+            ),
+        ),
+    ]
@@ -0,0 +1,83 @@
+# Generated by Django 2.2.17 on 2026-10-18 06:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+import homebytwo.routes.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("contenttypes", "0002_remove_content_type_name"),
+        ("routes", "0062_add_route_profile"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RouteSchedule",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "created",
+                    models.DateTimeField(
+                        auto_now_add=True, verbose_name="Time of last update"
+                    ),
+                ),
+                (
+                    "updated",
+                    models.DateTimeField(
+                        auto_now=True, verbose_name="Time of creation"
+                    ),
+                ),
+                ("object_id", models.PositiveIntegerField()),
+                ("max_error", models.FloatField(null=True)),
+                ("data_version", models.CharField(max_length=40)),
+                ("prediction_model_version", models.CharField(max_length=40)),
+                (
+                    "distance",
+                    homebytwo.routes.fields.NumpyArrayField(
+                        base_field=models.FloatField(), size=None
+                    ),
+                ),
+                (
+                    "pace",
+                    homebytwo.routes.fields.NumpyArrayField(
+                        base_field=models.FloatField(), size=None
+                    ),
+                ),
+                (
+                    "schedule",
+                    homebytwo.routes.fields.NumpyArrayField(
+                        base_field=models.FloatField(), size=None
+                    ),
+                ),
+                (
+                    "content_type",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="contenttypes.ContentType",
+                    ),
+                ),
+                (
+                    "route",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="schedules",
+                        to="routes.Route",
+                    ),
+                ),
+            ],
+            options={
+                "abstract": False,
+            },
+        ),
+    ]
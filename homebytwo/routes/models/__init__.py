@@ -5,4 +5,4 @@ from .event import WebhookTransaction  # NOQA
 from .place import Checkpoint, Place, PlaceType  # NOQA
 
 from .track import Track  # NOQA # isort:skip
-from .route import Route, RouteManager  # NOQA # isort:skip
+from .route import Route, RouteManager, RouteSchedule  # NOQA # isort:skip
@@ -1,6 +1,8 @@
 from abc import abstractmethod
+from hashlib import sha1
 from typing import List, Optional
 
+from django.contrib.contenttypes.fields import GenericRelation
 from django.contrib.gis.db import models
 from django.contrib.gis.measure import D
 from django.core.exceptions import FieldError
@@ -12,10 +14,16 @@ from stravalib import unithelper
 from stravalib.exc import ObjectNotFound
 
 from ...core.models import TimeStampedModel
-from ..fields import DataFrameField, NumpyArrayField
-from ..prediction_model import PredictionModel
+from ..fields import DataFrameField, DataFrameQuerySetMixin, NumpyArrayField
+from ..prediction_model import PredictionModel, prediction_model_cache
 
 STREAM_TYPES = ["time", "altitude", "distance", "moving"]
+TRAINING_STREAM_TYPES = ["time", "altitude", "distance"]
+STREAM_DTYPES = {
+    "time": "int32",
+    "altitude": "float32",
+    "moving": "bool",
+}
 STRAVA_ACTIVITY_URL = "https://www.strava.com/activities/{}"
 
 
@@ -98,7 +106,7 @@ def are_streams_valid(strava_streams):
     return True
 
 
-class ActivityQuerySet(models.QuerySet):
+class ActivityQuerySet(DataFrameQuerySetMixin, models.QuerySet):
     def for_user(self, user):
         """
         return all routes of a given user.
@@ -114,6 +122,9 @@ class ActivityManager(models.Manager):
     def for_user(self, user):
         return self.get_queryset().for_user(user)
 
+    def prefetch_dataframes(self, *field_names, **kwargs):
+        return self.get_queryset().prefetch_dataframes(*field_names, **kwargs)
+
 
 class Activity(TimeStampedModel):
     """
@@ -182,7 +193,10 @@ class Activity(TimeStampedModel):
 
     # streams retrieved from the Strava API
     streams = DataFrameField(
-        null=True, upload_to=athlete_streams_directory_path, unique_fields=["strava_id"]
+        null=True,
+        upload_to=athlete_streams_directory_path,
+        unique_fields=["strava_id"],
+        dtypes=STREAM_DTYPES,
     )
 
     # skip trying to import streams from Strava
@@ -342,8 +356,8 @@ class Activity(TimeStampedModel):
         return activity data for training the linear regression model.
         """
 
-        # load activity streams as a DataFrame
-        activity_data = self.streams
+        # load the activity streams required for training as a DataFrame
+        activity_data = self.load_streams(columns=TRAINING_STREAM_TYPES)
 
         # calculate gradient in percents, pace in minutes/kilometer and
         # cumulative elevation gain
@@ -409,6 +423,9 @@ class PredictedModel(models.Model):
     model_score = models.FloatField(default=0.0)
     cv_scores = NumpyArrayField(models.FloatField(), default=get_default_array)
 
+    # route schedules predicted with the model, deleted when it is trained again
+    route_schedules = GenericRelation("RouteSchedule")
+
     class Meta:
         abstract = True
 
@@ -454,7 +471,9 @@ class PredictedModel(models.Model):
         :param limit_activities: maximum number of Strava activities used to feed the
         prediction model, defaults to `None`, i.e. all available activities
         """
-        target_activities = self.get_training_activities(limit_activities)
+        target_activities = self.get_training_activities(
+            limit_activities
+        ).prefetch_dataframes("streams", columns=TRAINING_STREAM_TYPES)
 
         # collect activity_data into a pandas DataFrame
         observations = DataFrame()
@@ -535,6 +554,8 @@ class PredictedModel(models.Model):
             )
 
         self.save()
+        prediction_model_cache.invalidate(self.get_prediction_model_key())
+        self.route_schedules.all().delete()
 
         message = (
             f"{self} successfully trained with {data.shape[0]} observations. "
@@ -543,24 +564,62 @@ class PredictedModel(models.Model):
         )
         return message
 
+    def get_prediction_model_key(self):
+        """
+        return the key of the restored prediction model in the process cache
+        """
+        return self._meta.label, self.pk
+
+    def get_onehot_encoder_categories(self):
+        """
+        return the categories of the categorical columns found in training
+        """
+        return [
+            getattr(self, column + "_categories")
+            for column in self.get_categorical_columns()
+        ]
+
+    def get_prediction_model_version(self):
+        """
+        return a hash of the parameters saved by `train_prediction_model`
+        """
+        onehot_encoder_categories = self.get_onehot_encoder_categories()
+        version = sha1(repr(self.flat_parameter).encode())
+        version.update(array(self.regression_coefficients, dtype=float).tobytes())
+        version.update(repr([list(c) for c in onehot_encoder_categories]).encode())
+        return version.hexdigest()
+
     def get_prediction_model(self) -> PredictionModel:
         """
         restore the Prediction Model from the saved parameters
+
+        Restored models are kept in a process cache, see `PredictionModelCache`,
+        so that the pipeline is not restored for every route schedule.
+        The cached model is shared and must not be trained or modified.
         """
 
         # retrieve categorical columns and values
         categorical_columns = self.get_categorical_columns()
-        onehot_encoder_categories = []
-        for column in categorical_columns:
-            onehot_encoder_categories.append(getattr(self, column + "_categories"))
+        onehot_encoder_categories = self.get_onehot_encoder_categories()
 
-        return PredictionModel(
+        key = self.get_prediction_model_key()
+        version = self.get_prediction_model_version()
+        if self.pk is not None:
+            prediction_model = prediction_model_cache.get(key, version)
+            if prediction_model is not None:
+                return prediction_model
+
+        prediction_model = PredictionModel(
             regression_intercept=self.flat_parameter,
             regression_coefficients=self.regression_coefficients,
             categorical_columns=categorical_columns,
             onehot_encoder_categories=onehot_encoder_categories,
         )
 
+        if self.pk is not None:
+            prediction_model_cache.set(key, version, prediction_model)
+        return prediction_model
+
 
 class ActivityTypeQuerySet(models.QuerySet):
     def predicted(self):
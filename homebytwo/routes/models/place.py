@@ -2,6 +2,7 @@ from collections import namedtuple
 from datetime import datetime
 
 from django.contrib.gis.db import models
+from django.contrib.gis.measure import D
 from django.core.serializers import serialize
 
 from gpxpy.gpx import GPXWaypoint
@@ -164,32 +165,40 @@ class Checkpoint(models.Model):
     # location on the route normalized 0=start 1=end
     line_location = models.FloatField(default=0)
 
+    # values of the route data at the checkpoint, see `Track.annotate_checkpoints`
+    route_data = None
+
+    def get_route_data(self, data_column):
+        """
+        return the value of a column of the route data at the checkpoint,
+        annotated by `Track.annotate_checkpoints` or interpolated otherwise.
+        """
+        if self.route_data is not None and data_column in self.route_data:
+            return self.route_data[data_column]
+        return self.route.get_data(self.line_location, data_column)
+
     @property
     def altitude_on_route(self):
-        return self.route.get_distance_data(self.line_location, "altitude")
+        return D(m=self.get_route_data("altitude"))
 
     @property
     def distance_from_start(self):
-        return self.route.get_distance_data(self.line_location, "distance")
+        return D(m=self.get_route_data("distance"))
 
     @property
     def cumulative_elevation_gain(self):
-        return self.route.get_distance_data(
-            self.line_location, "cumulative_elevation_gain"
-        )
+        return D(m=self.get_route_data("cumulative_elevation_gain"))
 
     @property
     def cumulative_elevation_loss(self):
-        return self.route.get_distance_data(
-            self.line_location, "cumulative_elevation_loss", absolute=True
-        )
+        return D(m=abs(self.get_route_data("cumulative_elevation_loss")))
 
     @property
     def field_value(self):
         """
         value used in the ModelForm to serialize checkpoints
         """
-        return "{}_{}".format(self.place.id, self.line_location)
+        return "{}_{}".format(self.place_id, self.line_location)
 
     class Meta:
         ordering = ("line_location",)
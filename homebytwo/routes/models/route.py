@@ -6,7 +6,10 @@ from uuid import uuid4
 from django.apps import apps
 from django.conf import settings
 from django.contrib.auth.models import AnonymousUser
+from django.contrib.contenttypes.fields import GenericForeignKey
+from django.contrib.contenttypes.models import ContentType
 from django.contrib.gis.db import models
+from django.db import transaction
 from django.urls import reverse
 
 import gpxpy
@@ -14,10 +17,14 @@ import gpxpy.gpx
 import rules
 from garmin_uploader.api import GarminAPI, GarminAPIException
 from garmin_uploader.workflow import Activity as GarminActivity
+from pandas import DataFrame
 from requests.exceptions import HTTPError
 from rules.contrib.models import RulesModelBase, RulesModelMixin
 
+from ...core.models import TimeStampedModel
+from ..fields import DataFrameQuerySetMixin, NumpyArrayField
 from ..models import Checkpoint, Track
+from ..models.track import SCHEDULE_MAX_ERROR
 from ..utils import (
     GARMIN_ACTIVITY_TYPE_MAP,
     Link,
@@ -44,7 +51,7 @@ def route_can_be_updated(_, route):
     return False
 
 
-class RouteQuerySet(models.QuerySet):
+class RouteQuerySet(DataFrameQuerySetMixin, models.QuerySet):
     def for_user(self, user):
         """
         return all routes of a given user.
@@ -60,6 +67,9 @@ class RouteManager(models.Manager):
     def for_user(self, user):
         return self.get_queryset().for_user(user)
 
+    def prefetch_dataframes(self, *field_names, **kwargs):
+        return self.get_queryset().prefetch_dataframes(*field_names, **kwargs)
+
 
 def authenticate_on_garmin(garmin_api):
     # sign-in to Homebytwo account
@@ -125,6 +135,20 @@ class Route(RulesModelMixin, Track, metaclass=RulesModelBase):
             activity_type=str(self.activity_type), name=self.name
         )
 
+    def save(self, *args, **kwargs):
+        """
+        delete the saved schedules of the route when its data or activity type
+        may have changed.
+        """
+        adding = self._state.adding
+        super().save(*args, **kwargs)
+
+        update_fields = kwargs.get("update_fields")
+        if not adding and (
+            update_fields is None or {"data", "activity_type"} & set(update_fields)
+        ):
+            self.schedules.all().delete()
+
     def get_absolute_url(self, action="display"):
         """
         return the relative URL for the route based on the action requested.
@@ -138,6 +162,7 @@ class Route(RulesModelMixin, Track, metaclass=RulesModelBase):
             "edit": ("routes:edit", route_kwargs),
             "update": ("routes:update", route_kwargs),
             "delete": ("routes:delete", route_kwargs),
+            "schedule": ("routes:schedule", route_kwargs),
             "gpx": ("routes:gpx", route_kwargs),
             "garmin_upload": ("routes:garmin_upload", route_kwargs),
             "import": ("import_route", import_kwargs),
@@ -360,6 +385,63 @@ class Route(RulesModelMixin, Track, metaclass=RulesModelBase):
 
         return checkpoints
 
+    def get_base_schedule(
+        self, predicted_model, max_error=SCHEDULE_MAX_ERROR, gradient_tolerance=None
+    ):
+        """
+        return the schedule predicted without gear and workout type, see `Track`,
+        from the schedule saved for the same route data, prediction model and
+        maximum error, so that the prediction model is only run once.
+
+        Schedules predicted with a gradient tolerance are approximations:
+        they use the saved schedule if there is one but are never saved.
+        """
+        if self.pk is None or predicted_model.pk is None:
+            return super().get_base_schedule(
+                predicted_model, max_error, gradient_tolerance
+            )
+
+        schedules = self.schedules.filter(
+            content_type=ContentType.objects.get_for_model(predicted_model),
+            object_id=predicted_model.pk,
+            max_error=max_error,
+        )
+        prediction_model_version = predicted_model.get_prediction_model_version()
+
+        # read the saved schedule if the data file and the model are unchanged
+        data_version = self.get_data_version()
+        if data_version is not None:
+            saved_schedule = schedules.filter(
+                data_version=data_version,
+                prediction_model_version=prediction_model_version,
+            ).first()
+            if saved_schedule is not None:
+                return saved_schedule.get_schedule()
+
+        schedule = super().get_base_schedule(
+            predicted_model, max_error, gradient_tolerance
+        )
+
+        # the data is saved by the calculation if it was outdated
+        data_version = self.get_data_version()
+        if data_version is None or gradient_tolerance is not None:
+            return schedule
+
+        with transaction.atomic():
+            schedules.delete()
+            RouteSchedule.objects.create(
+                route=self,
+                predicted_model=predicted_model,
+                max_error=max_error,
+                data_version=data_version,
+                prediction_model_version=prediction_model_version,
+                distance=schedule.distance.to_numpy(),
+                pace=schedule.pace.to_numpy(),
+                schedule=schedule.schedule.to_numpy(),
+            )
+
+        return schedule
+
     def get_gpx(self, start_time=None):
         """
         returns the route as a GPX with track schedule and waypoints
@@ -424,22 +506,25 @@ class Route(RulesModelMixin, Track, metaclass=RulesModelBase):
         # create a clone of the route geom in SRID 4326
         geom = self.geom.transform(4326, clone=True)
 
+        # only retrieve the columns required for the GPX track points
+        data = self.load_data_arrays(["distance", "altitude"])
+        data["schedule"] = self.interpolate_data(data["distance"], "schedule")
+
         # we cannot start from the route geometry
         # because it can have a different number of coords than the number of rows
         # in the route data. We start from the distance column in the route data and
-        # save the corresponding Point in the Linestring geometry to lat, lng columns.
-        self.data["lng"], self.data["lat"] = zip(  # unpack list of coords tuples
-            *(self.data["distance"] / self.data["distance"].max())  # line location
-            .apply(lambda x: geom.interpolate_normalized(x).coords)  # get Point
-            .to_list()  # dump list of coords tuples
-        )
+        # get the corresponding Point in the Linestring geometry.
+        line_locations = data["distance"] / data["distance"].max()
+        coords = [
+            geom.interpolate_normalized(line_location).coords
+            for line_location in line_locations
+        ]
 
         # create the GPXTrackPoints from the route data and append them to the segment
-        for lng, lat, altitude, schedule in zip(
-            self.data.lng,
-            self.data.lat,
-            self.data.altitude,
-            self.data.schedule,
+        for (lng, lat), altitude, schedule in zip(
+            coords,
+            data["altitude"],
+            data["schedule"],
         ):
             gpx_track_point = gpxpy.gpx.GPXTrackPoint(
                 latitude=lat,
@@ -521,3 +606,53 @@ class Route(RulesModelMixin, Track, metaclass=RulesModelBase):
         else:
             self.garmin_id = None
             self.save(update_fields=["garmin_id"])
+
+
+class RouteSchedule(TimeStampedModel):
+    """
+    schedule of a route predicted with the model of an ActivityType
+    or an ActivityPerformance, saved so that routes can be displayed
+    and downloaded again without running the prediction model.
+
+    The pace and schedule are saved for the points of the simplified profile,
+    without the offset of the gear and workout type, see `Track.get_base_schedule`.
+    They are only read while the route data file and the parameters of the model
+    are unchanged.
+    """
+
+    route = models.ForeignKey(
+        "Route", on_delete=models.CASCADE, related_name="schedules"
+    )
+
+    # ActivityType or ActivityPerformance used for the prediction
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveIntegerField()
+    predicted_model = GenericForeignKey("content_type", "object_id")
+
+    # maximum error of the simplified profile
+    max_error = models.FloatField(null=True)
+
+    # versions of the route data and of the prediction model parameters
+    data_version = models.CharField(max_length=40)
+    prediction_model_version = models.CharField(max_length=40)
+
+    distance = NumpyArrayField(models.FloatField())
+    pace = NumpyArrayField(models.FloatField())
+    schedule = NumpyArrayField(models.FloatField())
+
+    def __str__(self):
+        return "Schedule of {route} for {model}".format(
+            route=self.route_id, model=self.predicted_model
+        )
+
+    def get_schedule(self):
+        """
+        return the schedule as calculated by `Track.get_base_schedule`
+        """
+        return DataFrame(
+            {
+                "distance": self.distance,
+                "pace": self.pace,
+                "schedule": self.schedule,
+            }
+        )
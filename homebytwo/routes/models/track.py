@@ -1,21 +1,74 @@
 import logging
 from datetime import timedelta
+from functools import partial
+from hashlib import sha1
 from uuid import uuid4
 
+from django.conf import settings
 from django.contrib.gis.db import models
-from django.contrib.gis.geos import LineString
 from django.contrib.gis.measure import D
 
 from easy_thumbnails.fields import ThumbnailerImageField
-from numpy import interp
+from numpy import asarray, interp
+from pandas import DataFrame
 
 from ...core.models import TimeStampedModel
+from ..dataframe_pipeline import DataFramePipeline, DerivedColumns
 from ..fields import DataFrameField
-from ..utils import get_image_path, get_places_within
+from ..utils import (
+    create_line,
+    get_coordinates,
+    get_gradient_mask,
+    get_image_path,
+    get_places_within,
+    get_simplified_profile_mask,
+    resample_profile,
+)
 from . import ActivityPerformance, ActivityType, Place
 
 logger = logging.getLogger(__name__)
 
+# compact dtypes of the track data columns saved to file.
+# Cumulative distances are kept as float64 to avoid rounding along long routes.
+TRACK_DATA_DTYPES = {
+    "altitude": "float32",
+    "gradient": "float32",
+}
+
+# compact dtypes of the resampled elevation profile saved to file
+TRACK_PROFILE_DTYPES = {
+    "altitude": "float32",
+}
+
+# derived columns of the track data required for schedule calculation.
+# Increment the version of a stage when its calculation changes: its columns
+# are calculated again the next time the data of a track is updated.
+TRACK_DATA_PIPELINE = DataFramePipeline(
+    DerivedColumns("step_distance", ["step_distance"], version=1),
+    DerivedColumns("gradient", ["gradient"], version=1, depends_on=["step_distance"]),
+    DerivedColumns(
+        "cumulative_elevation",
+        ["cumulative_elevation_gain", "cumulative_elevation_loss"],
+        version=1,
+        depends_on=["gradient"],
+    ),
+    DerivedColumns("totals", ["total_distance", "total_elevation_gain"], version=1),
+)
+
+# maximum error in seconds on the total time predicted on the simplified profile
+SCHEDULE_MAX_ERROR = 30
+
+# columns predicted for a track by `calculate_projected_time_schedule`
+SCHEDULE_COLUMNS = ["pace", "schedule"]
+
+# columns displayed for the checkpoints of a track, see `annotate_checkpoints`
+CHECKPOINT_COLUMNS = [
+    "altitude",
+    "distance",
+    "cumulative_elevation_gain",
+    "cumulative_elevation_loss",
+]
+
 
 def athlete_data_directory_path(instance, filename):
     # streams will upload to MEDIA_ROOT/athlete_<id>/<filename>
@@ -66,26 +119,75 @@ class Track(TimeStampedModel):
 
     # track data as a pandas DataFrame
     data = DataFrameField(
-        null=True, upload_to=athlete_data_directory_path, unique_fields=["uuid"]
+        null=True,
+        upload_to=athlete_data_directory_path,
+        unique_fields=["uuid"],
+        dtypes=TRACK_DATA_DTYPES,
+    )
+
+    # altitude resampled at a fixed distance step, see `update_profile`
+    profile = DataFrameField(
+        null=True,
+        upload_to=athlete_data_directory_path,
+        unique_fields=["uuid"],
+        dtypes=TRACK_PROFILE_DTYPES,
     )
 
+    # predicted pace and schedule, see `calculate_projected_time_schedule`
+    schedule = None
+
+    def save(self, *args, **kwargs):
+        """
+        clear the resampled profile when the track data is saved with changes
+        but without a new profile, so that no value is interpolated on the
+        profile of the previous data. The profile is resampled by
+        `update_permanent_track_data`.
+        """
+        update_fields = kwargs.get("update_fields")
+        if (
+            (update_fields is None or "data" in update_fields)
+            and self._meta.get_field("data").has_changed(self)
+            and not self._meta.get_field("profile").has_changed(self)
+            and self.has_profile()
+        ):
+            self.profile = None
+            if update_fields is not None:
+                kwargs["update_fields"] = list(update_fields) + ["profile"]
+
+        super().save(*args, **kwargs)
+
+    def get_coordinates(self):
+        """
+        return the coordinates of the track geometry as an (n, 2) NumPy array.
+
+        :raises ValueError: if the number of coords in the track geometry
+        is not equal to the number of rows in data.
+        """
+        coords = get_coordinates(self.geom)
+        if len(coords) != len(self.data):
+            raise ValueError(
+                f"Track geometry has {len(coords)} coords "
+                f"but track data has {len(self.data)} rows."
+            )
+        return coords
+
     def calculate_step_distances(self, min_distance: float, commit=True):
         """
         calculate distance between each row, removing steps where distance is too small.
         """
-        data = self.data.copy()
-        data["geom"], srid = self.geom, self.geom.srid
+        coords = self.get_coordinates()
 
-        data.drop(data[data.distance.diff() < min_distance].index, inplace=True)
+        # keep the first row and the rows far enough from the previous one
+        keep = ~(self.data.distance.diff() < min_distance).to_numpy()
+        data = self.data[keep].copy()
         data["step_distance"] = data.distance.diff()
 
         try:
-            self.geom = LineString(data.geom.tolist(), srid=srid)
+            self.geom = create_line(coords[keep], srid=self.geom.srid)
         except ValueError:
             message = "Cannot clean track data: invalid distance values."
             logger.error(message, exc_info=True)
             raise ValueError(message)
-        data.drop(columns=["geom"], inplace=True)
         self.data = data.fillna(value=0)
 
         if commit:
@@ -96,33 +198,22 @@ class Track(TimeStampedModel):
         calculate gradients in percents based on altitude and distance
         while cleaning up bad values.
         """
-        data = self.data.copy()
-        data["geom"], srid = self.geom, self.geom.srid
+        coords = self.get_coordinates()
+
+        # drop rows with offending gradients, see `get_gradient_mask`
+        keep = get_gradient_mask(self.data.distance, self.data.altitude, max_gradient)
+        data = self.data[keep].copy()
 
         # calculate gradients
         data["gradient"] = data.altitude.diff() / data.distance.diff() * 100
 
-        # find rows with offending gradients
-        bad_rows = data[
-            (data["gradient"] < -max_gradient) | (data["gradient"] > max_gradient)
-        ]
-
-        # drop bad rows and recalculate until all offending values have been removed
-        while not bad_rows.empty:
-            data.drop(bad_rows.index, inplace=True)
-            data["gradient"] = data.altitude.diff() / data.distance.diff() * 100
-            bad_rows = data[
-                (data["gradient"] < -max_gradient) | (data["gradient"] > max_gradient)
-            ]
-
         # save the values back to the track object
         try:
-            self.geom = LineString(data.geom.tolist(), srid=srid)
+            self.geom = create_line(coords[keep], srid=self.geom.srid)
         except ValueError:
             message = "Cannot clean track data: invalid altitude values."
             logger.error(message, exc_info=True)
             raise ValueError(message)
-        data.drop(columns=["geom"], inplace=True)
         self.data = data.fillna(value=0)
 
         if commit:
@@ -171,56 +262,75 @@ class Track(TimeStampedModel):
     ):
         """
         make sure all unvarying data columns required for
-        schedule calculation are available.
+        schedule calculation are available and up-to-date.
+
+        Only the stages of TRACK_DATA_PIPELINE with missing columns or columns
+        saved with a previous version are calculated, with the stages depending
+        on them. Schedule calculation calls this method, so that outdated
+        columns are updated and saved the first time the track is read.
 
         :param min_step_distance: minimum distance in m to keep between each point
         :param max_gradient: maximum gradient to keep when cleaning rows
         :param commit: save the instance to the database after update
-        :param force: recalculates columns even if they are already present
+        :param force: recalculates columns even if they are up-to-date
 
         :returns: None
         :raises ValueError: if the number of coords in the track geometry
         is not equal to the number of rows in data or if the cleaned data columns
         are left with only one row.
         """
-        # flag if any of the data columns have been updated
-        track_data_updated = False
+        calculations = {
+            "step_distance": partial(
+                self.calculate_step_distances, min_distance=min_step_distance
+            ),
+            "gradient": partial(self.calculate_gradients, max_gradient=max_gradient),
+            "cumulative_elevation": self.calculate_cumulative_elevation_differences,
+            "totals": self.add_distance_and_elevation_totals,
+        }
+
+        stale_stages = TRACK_DATA_PIPELINE.get_stale_stages(self.data, force=force)
+        for stage in stale_stages:
+            calculations[stage.name](commit=False)
+
+        update_fields = []
+        if stale_stages:
+            TRACK_DATA_PIPELINE.set_versions(self.data, stale_stages)
+            update_fields += ["data", "geom"]
+
+        # resample the elevation profile if it is enabled and outdated
+        step = getattr(settings, "TRACK_PROFILE_STEP", 0)
+        if step and (
+            stale_stages
+            or self.profile is None
+            or self.profile.attrs.get("step") != step
+        ):
+            self.update_profile(step, commit=False)
+            update_fields.append("profile")
 
-        # make sure we have step distances
-        if "step_distance" not in self.data.columns or force:
-            track_data_updated = True
-            self.calculate_step_distances(min_distance=min_step_distance, commit=False)
+        # commit changes to the database if any
+        if update_fields and commit:
+            self.save(update_fields=update_fields)
 
-        # make sure we have step gradients
-        if "gradient" not in self.data.columns or force:
-            track_data_updated = True
-            self.calculate_gradients(max_gradient=max_gradient, commit=False)
+    def update_profile(self, step=None, commit=True):
+        """
+        resample the altitude of the track data at a fixed distance step.
 
-        # make sure we have cumulative elevation differences
-        if (
-            not all(
-                column in self.data.columns
-                for column in ["cumulative_elevation_gain", "cumulative_elevation_loss"]
-            )
-            or force
-        ):
-            track_data_updated = True
-            self.calculate_cumulative_elevation_differences(commit=False)
+        The profile has the same number of points for tracks of the same length,
+        whatever the sampling rate of the track data, so that checkpoints and
+        elevation charts are interpolated at a predictable cost.
 
-        # make sure we have distance and elevation totals
-        if (
-            not all(
-                column in self.data.columns
-                for column in ["total_distance", "total_elevation_gain"]
-            )
-            or force
-        ):
-            track_data_updated = True
-            self.add_distance_and_elevation_totals(commit=False)
+        :param step: distance in m between the points of the profile,
+        defaults to the TRACK_PROFILE_STEP setting.
+        """
+        step = step or getattr(settings, "TRACK_PROFILE_STEP", 0)
+        distance, altitude = resample_profile(
+            self.data.distance, self.data.altitude, step
+        )
+        self.profile = DataFrame({"distance": distance, "altitude": altitude})
+        self.profile.attrs["step"] = step
 
-        # commit changes to the database if any
-        if track_data_updated and commit:
-            self.save(update_fields=["data", "geom"])
+        if commit:
+            self.save(update_fields=["profile"])
 
     def update_track_details_from_data(self, commit=True):
         """
@@ -247,9 +357,9 @@ class Track(TimeStampedModel):
                 ]
             )
 
-    def get_prediction_model(self, user):
+    def get_predicted_model(self, user):
         """
-        get the prediction model from the Model instance containing prediction values
+        get the Model instance containing prediction values
 
         Use an instance of ActivityPerformance if it exists for the athlete and
         activity type. Fallback on ActivityType otherwise.
@@ -257,43 +367,117 @@ class Track(TimeStampedModel):
         if user.is_authenticated:
             try:
                 performance = user.athlete.performances
-                performance = performance.filter(activity_type=self.activity_type).get()
-                return performance.get_prediction_model()
+                return performance.filter(activity_type=self.activity_type).get()
             except ActivityPerformance.DoesNotExist:
                 pass
 
         # no ActivityPerformance for the user, fallback on ActivityType
-        return self.activity_type.get_prediction_model()
+        return self.activity_type
+
+    def get_prediction_model(self, user):
+        """
+        get the prediction model from the Model instance containing prediction values
+        """
+        return self.get_predicted_model(user).get_prediction_model()
 
-    def calculate_projected_time_schedule(self, user, workout_type=None, gear=None):
+    def calculate_projected_time_schedule(
+        self,
+        user,
+        workout_type=None,
+        gear=None,
+        max_error=SCHEDULE_MAX_ERROR,
+        gradient_tolerance=None,
+    ):
         """
         Calculates route pace and route schedule based on the athlete's prediction model
         for the route's activity type.
+
+        The pace and schedule are kept in the `schedule` DataFrame,
+        apart from the track data, and interpolated for the other points,
+        see `get_data`.
+
+        The gear and the workout type add a constant to the pace of every point:
+        they are added to the schedule predicted without them, see
+        `get_base_schedule`, so that changing them does not run the prediction.
+
+        :param max_error: maximum error in seconds on the total time,
+        `None` to predict the pace of every point.
+        :param gradient_tolerance: maximum error in percents on the gradients,
+        rounded to predict the pace once per distinct gradient, see
+        `PredictionModel.predict_numerical`.
+        """
+        predicted_model = self.get_predicted_model(user)
+        schedule = self.get_base_schedule(
+            predicted_model, max_error, gradient_tolerance
+        )
+
+        offset = predicted_model.get_prediction_model().get_categorical_offset(
+            {"gear": gear or "None", "workout_type": workout_type or "None"}
+        )
+        schedule["pace"] += offset
+        schedule["schedule"] += offset * (schedule.distance - schedule.distance[0])
+
+        self.schedule = schedule
+
+    def get_base_schedule(
+        self, predicted_model, max_error=SCHEDULE_MAX_ERROR, gradient_tolerance=None
+    ):
+        """
+        return the distance, pace and schedule of the simplified elevation profile,
+        predicted with the model of an ActivityType or an ActivityPerformance
+        from the numerical columns only.
+
+        The pace is predicted on a simplified elevation profile, see
+        `get_simplified_profile`, so that the cost of the prediction depends on the
+        terrain rather than on the sampling rate of the track. With a gradient
+        tolerance, it is predicted once per distinct gradient of the profile.
         """
         # make sure we have all required data columns
         self.update_permanent_track_data()
 
-        # add temporary columns useful to the schedule calculation
-        data = self.data
+        # restore prediction model for athlete and activity_type
+        prediction_model = predicted_model.get_prediction_model()
+
+        # calculate pace and schedule columns for the simplified profile
+        profile = self.get_simplified_profile(
+            max_error, prediction_model.get_gradient_curvature()
+        )
+        profile["pace"] = prediction_model.predict_numerical(
+            profile, gradient_tolerance
+        )
+        profile["schedule"] = (
+            (profile.pace * profile.step_distance).cumsum().fillna(value=0)
+        )
 
-        # add gear and workout type to every row
-        data["gear"] = gear or "None"
-        data["workout_type"] = workout_type or "None"
+        return profile[["distance"] + SCHEDULE_COLUMNS].reset_index(drop=True)
 
-        # restore prediction model for athlete and activity_type
-        prediction_model = self.get_prediction_model(user)
+    def get_simplified_profile(self, max_error, curvature):
+        """
+        return the rows of the track data kept by the simplification of
+        the elevation profile, with the gradients and step distances between them.
 
-        # keep model pipelines and columns in local variable for readability
-        pipeline = prediction_model.pipeline
-        numerical_columns = prediction_model.numerical_columns
-        categorical_columns = prediction_model.categorical_columns
-        feature_columns = numerical_columns + categorical_columns
+        :param max_error: maximum error in seconds on the total time,
+        `None` to keep every row.
+        :param curvature: coefficient of the squared gradient in the pace
+        prediction, see `get_simplified_profile_mask`.
+        """
+        data = self.data
+        if max_error is None:
+            return data.copy()
 
-        # calculate pace and schedule columns for the route
-        data["pace"] = pipeline.predict(data[feature_columns])
-        data["schedule"] = (data.pace * data.step_distance).cumsum().fillna(value=0)
+        max_gradient_error = max_error / curvature if curvature else float("inf")
+        keep = get_simplified_profile_mask(
+            data.distance, data.altitude, max_gradient_error
+        )
+        profile = data[keep].copy()
 
-        self.data = data
+        profile["step_distance"] = profile.distance.diff().fillna(value=0)
+        profile["gradient"] = (
+            (profile.altitude.diff() / profile.step_distance * 100)
+            .fillna(value=0)
+            .where(profile.step_distance > 0, 0)
+        )
+        return profile
 
     def get_data(self, line_location, data_column):
         """
@@ -303,11 +487,113 @@ class Track(TimeStampedModel):
 
         # calculate the distance value to interpolate with
         # based on line location and the total length of the track.
-        interp_x = line_location * self.total_distance
+        return self.interpolate_data(line_location * self.total_distance, data_column)
+
+    def interpolate_data(self, distance, data_column):
+        """
+        interpolate the values of a given column in the DataFrame
+        at one or more distances from the start of the track.
+        """
+        return self.interpolate_columns(distance, [data_column])[data_column]
+
+    def interpolate_columns(self, distance, data_columns):
+        """
+        interpolate the values of the given columns in the DataFrame
+        at one or more distances from the start of the track.
+
+        :returns: a dict of the interpolated values of each column
+        """
+        # predicted columns are read from the schedule calculated for the track,
+        # other columns from the resampled profile if the track has one with
+        # the column, or from the track data. Each source is read once with
+        # only the columns required.
+        sources = {"schedule": [], "profile": [], "data": []}
+        for data_column in dict.fromkeys(data_columns):
+            if data_column in SCHEDULE_COLUMNS and self.schedule is not None:
+                sources["schedule"].append(data_column)
+            elif data_column in TRACK_PROFILE_DTYPES and self.has_profile():
+                sources["profile"].append(data_column)
+            else:
+                sources["data"].append(data_column)
+
+        values = {}
+        for source, source_columns in sources.items():
+            if not source_columns:
+                continue
+
+            columns = list(dict.fromkeys(["distance"] + source_columns))
+            if source == "schedule":
+                data = self.schedule
+            elif source == "profile":
+                data = self.load_profile_arrays(columns)
+
+                # the profile file cannot be read: use the track data instead
+                if data is None:
+                    sources["data"] += source_columns
+                    continue
+            else:
+                data = self.load_data_arrays(columns)
+
+            # interpolate the values, see:
+            # https://docs.scipy.org/doc/numpy/reference/generated/numpy.interp.html
+            distances = data["distance"]
+            for data_column in columns:
+                values[data_column] = interp(distance, distances, data[data_column])
+
+        return {data_column: values[data_column] for data_column in data_columns}
+
+    def annotate_locations(self, line_locations, columns):
+        """
+        interpolate the values of the given columns in the DataFrame at
+        all line locations at once, see `interpolate_columns`.
+
+        :returns: a dict of the arrays of values of each column,
+        in the order of the line locations
+        """
+        distances = asarray(line_locations, dtype=float) * self.total_distance
+        return self.interpolate_columns(distances, columns)
 
-        # interpolate the value, see:
-        # https://docs.scipy.org/doc/numpy/reference/generated/numpy.interp.html
-        return interp(interp_x, self.data["distance"], self.data[data_column])
+    def annotate_checkpoints(self, checkpoints, columns=CHECKPOINT_COLUMNS):
+        """
+        set the values of the given columns at the location of the checkpoints,
+        interpolated in a single batch, see `Checkpoint.get_route_data`.
+
+        :returns: the list of annotated checkpoints
+        """
+        checkpoints = list(checkpoints)
+        values = self.annotate_locations(
+            [checkpoint.line_location for checkpoint in checkpoints], columns
+        )
+        for index, checkpoint in enumerate(checkpoints):
+            checkpoint.route = self
+            checkpoint.route_data = {
+                column: column_values[index] for column, column_values in values.items()
+            }
+
+        return checkpoints
+
+    def get_data_version(self):
+        """
+        return a hash identifying the track data saved to storage and the versions
+        of its derived columns, or `None` if the data has not been saved
+        or has been changed since it was read.
+        """
+        data_version = self._meta.get_field("data").get_version(self)
+        if data_version is None:
+            return None
+
+        version = sha1(repr(data_version).encode())
+        stages = TRACK_DATA_PIPELINE.stages
+        version.update(repr({stage.name: stage.version for stage in stages}).encode())
+        return version.hexdigest()
+
+    def has_profile(self):
+        """
+        whether the track has a resampled profile, without reading it from storage.
+        """
+        if "profile" not in self.__dict__:
+            self.refresh_from_db(fields=["profile"])
+        return self.__dict__["profile"] is not None
 
     def get_distance_data(self, line_location, data_column, absolute=False):
         """
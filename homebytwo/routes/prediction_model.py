@@ -1,11 +1,19 @@
-from numpy import array
-from pandas import DataFrame
+from collections import OrderedDict
+from itertools import combinations_with_replacement
+from threading import Lock
+
+from numpy import arange, array, asarray, full, isfinite, rint
+from pandas import DataFrame, factorize
 from sklearn.compose import make_column_transformer
+from sklearn.exceptions import NotFittedError
 from sklearn.linear_model import LinearRegression
 from sklearn.model_selection import cross_val_score, train_test_split
 from sklearn.pipeline import make_pipeline
 from sklearn.preprocessing import OneHotEncoder, PolynomialFeatures
 
+# number of restored prediction models kept in memory by each process
+PREDICTION_MODEL_CACHE_SIZE = 256
+
 
 class PredictionModel:
     """
@@ -16,6 +24,9 @@ class PredictionModel:
 
     to use the pipeline for training, no parameter is required when initializing the model instance.
     to restore the model for predictions, pass the regression and preproccessing parameters found in training.
+
+    restored models predict with `predict`, which evaluates the regression
+    coefficients with NumPy: the sklearn pipeline is only built when it is used.
     """
 
     def __init__(
@@ -53,8 +64,35 @@ class PredictionModel:
         else:
             self.onehot_encoder_categories = "auto"
 
-        # use these categories for creating the preprocessor
-        self.preprocessor = make_column_transformer(
+        self.model_score = 0.0
+        self.cv_scores = array([0] * 5)
+
+        # restore trained model if regression parameters are provided
+        self.regression_intercept = None
+        self.regression_coefficients = None
+        if regression_intercept and regression_coefficients is not None:
+            self.regression_intercept = regression_intercept
+            self.regression_coefficients = regression_coefficients
+
+        self._pipeline = None
+        self._kernel = None
+
+    @property
+    def pipeline(self):
+        """
+        the sklearn pipeline, created on first use.
+        """
+        if self._pipeline is None:
+            self._pipeline = self.create_pipeline()
+        return self._pipeline
+
+    def create_pipeline(self):
+        """
+        join the preprocessor and the linear model into a pipeline,
+        restoring the trained parameters if any.
+        """
+        # use the categories of the model for creating the preprocessor
+        preprocessor = make_column_transformer(
             (
                 OneHotEncoder(
                     handle_unknown="ignore", categories=self.onehot_encoder_categories
@@ -64,17 +102,15 @@ class PredictionModel:
             (PolynomialFeatures(2), self.polynomial_columns),
             remainder="passthrough",
         )
-        self.model_score = 0.0
-        self.cv_scores = array([0] * 5)
 
         # to use the pipeline for predictions,
         # we must fit the preprocessor with dummy data first
-        if onehot_encoder_categories:
+        if not isinstance(self.onehot_encoder_categories, str):
             # any numerical value will do
             dummy_numerical_data = [1.0] * len(self.numerical_columns)
             # category must be recognised by the one-hot encoder
             dummy_categorical_data = [
-                category_list[0] for category_list in onehot_encoder_categories
+                category_list[0] for category_list in self.onehot_encoder_categories
             ]
 
             # create a DataFrame with one row
@@ -84,19 +120,16 @@ class PredictionModel:
             )
 
             # fit the preprocessor on dummy data
-            self.preprocessor.fit(dummy_row)
+            preprocessor.fit(dummy_row)
 
-        # join preprocessor and linear model into a pipeline
-        self.pipeline = make_pipeline(
-            self.preprocessor,
-            LinearRegression(),
-        )
+        pipeline = make_pipeline(preprocessor, LinearRegression())
 
-        # restore trained model if regression parameters are provided
-        if regression_intercept and regression_coefficients is not None:
-            regression = self.pipeline.named_steps["linearregression"]
-            regression.coef_ = regression_coefficients
-            regression.intercept_ = regression_intercept
+        if self.regression_coefficients is not None:
+            regression = pipeline.named_steps["linearregression"]
+            regression.coef_ = self.regression_coefficients
+            regression.intercept_ = self.regression_intercept
+
+        return pipeline
 
     def train(self, y, x, test_size=0.3):
         """
@@ -119,3 +152,249 @@ class PredictionModel:
                 .named_transformers_["onehotencoder"]
                 .categories_
             )
+
+        # update the regression parameters used for predictions
+        regression = self.pipeline.named_steps["linearregression"]
+        self.regression_intercept = regression.intercept_
+        self.regression_coefficients = regression.coef_
+        self._kernel = None
+        self.__dict__.pop("_gradient_curvature", None)
+
+    def get_kernel(self):
+        """
+        compile the regression coefficients into the terms of the prediction,
+        in the order of the features created by the pipeline:
+
+            * the pace offset of every category of the categorical columns,
+            * the polynomial features of degree 2 of the polynomial columns,
+            * the other numerical columns, passed through.
+
+        The bias of the polynomial features is added to the intercept.
+        """
+        if self._kernel is not None:
+            return self._kernel
+
+        if self.regression_coefficients is None:
+            raise NotFittedError("The prediction model has not been trained.")
+
+        coefficients = iter(asarray(self.regression_coefficients, dtype=float))
+        intercept = float(self.regression_intercept)
+
+        # unknown categories are ignored, like in the one-hot encoder
+        offsets = {}
+        if self.categorical_columns:
+            for column, categories in zip(
+                self.categorical_columns, self.onehot_encoder_categories
+            ):
+                offsets[column] = {
+                    category: coefficient
+                    for category, coefficient in zip(categories, coefficients)
+                }
+
+        # products of the polynomial columns, with the order of PolynomialFeatures
+        polynomial_terms = []
+        for degree in range(3):
+            for indices in combinations_with_replacement(
+                range(len(self.polynomial_columns)), degree
+            ):
+                polynomial_terms.append(
+                    ([self.polynomial_columns[i] for i in indices], next(coefficients))
+                )
+        intercept += polynomial_terms.pop(0)[1]
+
+        # remaining numerical columns are passed through
+        linear_terms = [
+            (column, next(coefficients))
+            for column in self.numerical_columns
+            if column not in self.polynomial_columns
+        ]
+
+        if next(coefficients, None) is not None:
+            raise ValueError("The regression coefficients do not match the columns.")
+
+        self._kernel = (intercept, offsets, polynomial_terms, linear_terms)
+        return self._kernel
+
+    def predict(self, data):
+        """
+        return the pace predicted for every row of the DataFrame
+        with the restored or trained regression parameters.
+
+        The result is the result of the pipeline, calculated with NumPy
+        rather than by transforming the data into a matrix of features.
+        """
+        _, offsets, _, _ = self.get_kernel()
+        pace = self.predict_numerical(data)
+
+        # map each distinct category to its offset, missing values have code -1
+        for column, category_offsets in offsets.items():
+            codes, categories = factorize(data[column])
+            category_offsets = array(
+                [category_offsets.get(category, 0.0) for category in categories] + [0.0]
+            )
+            pace += category_offsets[codes]
+
+        return pace
+
+    def predict_numerical(self, data, gradient_tolerance=None):
+        """
+        return the pace predicted for every row of the DataFrame from
+        the numerical columns only, i.e. for categories unknown to the model.
+
+        The categorical columns add a constant to the pace,
+        see `get_categorical_offset`.
+
+        :param gradient_tolerance: if set, the gradient is rounded to bins of twice
+        the tolerance and the pace is predicted once per bin, then mapped back to
+        the rows with the index of their bin. Long data with constant numerical
+        columns besides the gradient is then predicted in the time of the
+        number of bins. Other data is predicted exactly.
+        """
+        _, _, _, linear_terms = self.get_kernel()
+
+        columns = {
+            column: data[column].to_numpy(dtype=float)
+            for column in set(self.polynomial_columns)
+            | {column for column, _ in linear_terms}
+        }
+
+        gradient = columns.get("gradient")
+        if (
+            not gradient_tolerance
+            or gradient is None
+            or not len(gradient)
+            or not isfinite(gradient).all()
+            or any(
+                (values != values[0]).any()
+                for column, values in columns.items()
+                if column != "gradient"
+            )
+        ):
+            return self.evaluate_kernel(columns, len(data))
+
+        bin_width = 2 * gradient_tolerance
+        bins = rint(gradient / bin_width).astype(int)
+        first_bin = bins.min()
+        bins -= first_bin
+        size = bins.max() + 1
+        if size >= len(gradient):
+            return self.evaluate_kernel(columns, len(data))
+
+        bin_columns = {
+            column: full(size, values[0]) for column, values in columns.items()
+        }
+        bin_columns["gradient"] = (arange(size) + first_bin) * bin_width
+
+        return self.evaluate_kernel(bin_columns, size)[bins]
+
+    def evaluate_kernel(self, columns, size):
+        """
+        return the pace predicted from the numerical columns of `size` rows,
+        given as a dict of NumPy arrays, see `get_kernel`.
+        """
+        intercept, _, polynomial_terms, linear_terms = self.get_kernel()
+
+        pace = full(size, intercept)
+
+        for term_columns, coefficient in polynomial_terms:
+            term = coefficient
+            for column in term_columns:
+                term = term * columns[column]
+            pace += term
+
+        for column, coefficient in linear_terms:
+            pace += coefficient * columns[column]
+
+        return pace
+
+    def get_categorical_offset(self, categories):
+        """
+        return the pace added to the numerical prediction by the categories
+        of the categorical columns, e.g. {"gear": "g123", "workout_type": "race"}.
+
+        Columns missing from `categories` and unknown categories add nothing.
+        """
+        _, offsets, _, _ = self.get_kernel()
+        return sum(
+            category_offsets.get(categories.get(column), 0.0)
+            for column, category_offsets in offsets.items()
+        )
+
+    def get_gradient_curvature(self):
+        """
+        return the absolute value of c in the pace predicted as a function of the
+        gradient in percents: a + b * gradient + c * gradient ** 2.
+
+        The coefficient is measured on the predictions for three gradients,
+        with the other features of the model set to zero or "None".
+        """
+        if not hasattr(self, "_gradient_curvature"):
+            probe = DataFrame(
+                {
+                    **{column: [0.0, 0.0, 0.0] for column in self.numerical_columns},
+                    **{column: ["None"] * 3 for column in self.categorical_columns},
+                    "gradient": [-10.0, 0.0, 10.0],
+                }
+            )
+            downhill, flat, uphill = self.predict(probe)
+            self._gradient_curvature = abs(downhill - 2 * flat + uphill) / 200
+
+        return self._gradient_curvature
+
+
+class PredictionModelCache:
+    """
+    process-local LRU cache of the prediction models restored from the parameters
+    saved by ActivityType and ActivityPerformance.
+
+    Entries are keyed by model class and primary key and only returned while
+    the version of the saved parameters is unchanged, so that models trained
+    by another process are restored again. The least recently used entries
+    are evicted first.
+
+    Cached prediction models are shared: callers must not train or modify them.
+    """
+
+    def __init__(self, max_size=PREDICTION_MODEL_CACHE_SIZE):
+        self.entries = OrderedDict()
+        self.max_size = max_size
+        self.lock = Lock()
+
+    def get(self, key, version):
+        """
+        return the cached prediction model or `None` if it was restored
+        from another version of the parameters.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+
+            entry_version, prediction_model = entry
+            if entry_version != version:
+                del self.entries[key]
+                return None
+
+            self.entries.move_to_end(key)
+            return prediction_model
+
+    def set(self, key, version, prediction_model):
+        with self.lock:
+            self.entries[key] = (version, prediction_model)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, key):
+        """
+        remove a prediction model from the cache, e.g. after training.
+        """
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+prediction_model_cache = PredictionModelCache()
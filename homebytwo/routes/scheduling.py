@@ -0,0 +1,175 @@
+import logging
+from collections import defaultdict, namedtuple
+from datetime import timedelta
+
+from numpy import concatenate, cumsum, empty, interp, prod, split, zeros
+
+from .models import Checkpoint
+from .models.track import SCHEDULE_MAX_ERROR, TRACK_DATA_PIPELINE
+
+logger = logging.getLogger(__name__)
+
+# total duration and checkpoint schedules of a route predicted with a model
+BatchSchedule = namedtuple(
+    "BatchSchedule",
+    ["route", "predicted_model", "total_duration", "checkpoint_schedules"],
+)
+
+
+def get_coefficient_matrix(prediction_models, categories):
+    """
+    return the terms of the pace predicted by the models and the matrix of their
+    coefficients, with one row per term and one column per model.
+
+    Terms are the tuples of the columns multiplied together: `()` for the
+    intercept, `("gradient", "gradient")` for the squared gradient, etc.
+    The last row holds the offsets of the categories, see `batch_schedule`.
+    """
+    kernels = [prediction_model.get_kernel() for prediction_model in prediction_models]
+
+    terms = [()]
+    for _, _, polynomial_terms, linear_terms in kernels:
+        for columns, _ in polynomial_terms:
+            terms.append(tuple(sorted(columns)))
+        for column, _ in linear_terms:
+            terms.append((column,))
+    terms = list(dict.fromkeys(terms))
+    rows = {term: row for row, term in enumerate(terms)}
+
+    coefficients = zeros((len(terms) + 1, len(prediction_models)))
+    for index, (intercept, _, polynomial_terms, linear_terms) in enumerate(kernels):
+        coefficients[0, index] = intercept
+        for columns, coefficient in polynomial_terms:
+            coefficients[rows[tuple(sorted(columns))], index] += coefficient
+        for column, coefficient in linear_terms:
+            coefficients[rows[(column,)], index] += coefficient
+
+        coefficients[-1, index] = prediction_models[index].get_categorical_offset(
+            categories
+        )
+
+    return terms, coefficients
+
+
+def get_cumulative_features(profile, terms):
+    """
+    return the cumulative sums of the terms of the pace prediction multiplied by
+    the step distance, for every point of the profile, followed by the distance
+    from the start used for the offsets of the categories.
+    """
+    features = empty((len(profile), len(terms) + 1))
+    columns = {}
+    for index, term in enumerate(terms):
+        for column in term:
+            if column not in columns:
+                columns[column] = profile[column].to_numpy(dtype=float)
+        features[:, index] = prod([columns[column] for column in term], axis=0)
+
+    features[:, :-1] *= profile.step_distance.to_numpy(dtype=float)[:, None]
+    features[:, :-1] = cumsum(features[:, :-1], axis=0)
+
+    distance = profile.distance.to_numpy(dtype=float)
+    features[:, -1] = distance - distance[0]
+    return features
+
+
+def batch_schedule(
+    routes, predicted_models, workout_type=None, gear=None, max_error=SCHEDULE_MAX_ERROR
+):
+    """
+    return the total duration and the checkpoint schedules of every route
+    predicted with every ActivityType or ActivityPerformance,
+    as a list of `BatchSchedule` ordered by route, then by model.
+
+    The simplified profile of every route is calculated once for all models,
+    see `Track.get_simplified_profile`, with the largest gradient curvature
+    of the models, so that `max_error` holds for all of them. The pace being
+    linear in the terms of the prediction, the schedules of all routes and
+    models are the product of the cumulative sums of the terms at the end
+    and at the checkpoints of the routes with the matrix of the coefficients
+    of the models.
+
+    The stored track data of the routes is used as it is: routes with derived
+    columns missing or calculated with a previous version are skipped and
+    logged, see `Track.update_permanent_track_data`.
+
+    :param gear: gear of all the schedules, as in
+    `Track.calculate_projected_time_schedule`
+    :param workout_type: workout type of all the schedules
+    :param max_error: maximum error in seconds on the total time
+    """
+    predicted_models = list(predicted_models)
+
+    fresh_routes, stale_routes = [], []
+    for route in routes:
+        if TRACK_DATA_PIPELINE.get_stale_stages(route.data):
+            stale_routes.append(route)
+        else:
+            fresh_routes.append(route)
+
+    if stale_routes:
+        logger.warning(
+            "Skipping routes with stale track data: %s",
+            ", ".join(str(route.pk) for route in stale_routes),
+        )
+    routes = fresh_routes
+
+    if not routes or not predicted_models:
+        return []
+
+    prediction_models = [
+        predicted_model.get_prediction_model() for predicted_model in predicted_models
+    ]
+    categories = {"gear": gear or "None", "workout_type": workout_type or "None"}
+    terms, coefficients = get_coefficient_matrix(prediction_models, categories)
+    curvature = max(
+        prediction_model.get_gradient_curvature()
+        for prediction_model in prediction_models
+    )
+
+    route_checkpoints = defaultdict(list)
+    checkpoints = Checkpoint.objects.filter(route__in=[route.pk for route in routes])
+    for checkpoint in checkpoints.order_by("line_location"):
+        route_checkpoints[checkpoint.route_id].append(checkpoint)
+
+    # cumulative sums of the terms at the end and at the checkpoints of every route
+    features = []
+    for route in routes:
+        profile = route.get_simplified_profile(max_error, curvature)
+        cumulative_features = get_cumulative_features(profile, terms)
+
+        distances = [
+            checkpoint.line_location * route.total_distance
+            for checkpoint in route_checkpoints[route.pk]
+        ]
+        checkpoint_features = empty((len(distances), len(terms) + 1))
+        for index in range(len(terms) + 1):
+            checkpoint_features[:, index] = interp(
+                distances, profile.distance, cumulative_features[:, index]
+            )
+
+        features.append(concatenate([cumulative_features[-1:], checkpoint_features]))
+
+    # one row per route end and checkpoint, one column per model
+    schedules = concatenate(features) @ coefficients
+    route_ends = cumsum([len(route_features) for route_features in features])
+
+    results = []
+    for route, route_schedules in zip(routes, split(schedules, route_ends[:-1])):
+        total_durations, checkpoint_schedules = route_schedules[0], route_schedules[1:]
+        for index, predicted_model in enumerate(predicted_models):
+            results.append(
+                BatchSchedule(
+                    route=route,
+                    predicted_model=predicted_model,
+                    total_duration=timedelta(seconds=int(total_durations[index])),
+                    checkpoint_schedules=[
+                        (checkpoint, timedelta(seconds=int(schedule[index])))
+                        for checkpoint, schedule in zip(
+                            route_checkpoints[route.pk], checkpoint_schedules
+                        )
+                    ],
+                )
+            )
+
+    return results
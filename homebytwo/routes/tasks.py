@@ -19,6 +19,9 @@ from .models.activity import is_activity_supported, update_user_activities_from_
 
 logger = logging.getLogger(__name__)
 
+# number of routes per task saving route schedules after training
+ROUTE_SCHEDULES_CHUNK_SIZE = 20
+
 
 @shared_task
 def import_strava_activities_task(athlete_id):
@@ -116,11 +119,53 @@ def train_prediction_models_task(athlete_id):
         activity_performance, created = ActivityPerformance.objects.get_or_create(
             athlete=athlete, activity_type=activity.activity_type
         )
+        version = activity_performance.get_prediction_model_version()
         message += activity_performance.train_prediction_model()
 
+        # the model was not trained, e.g. there was no training data
+        if activity_performance.get_prediction_model_version() == version:
+            continue
+
+        # save the schedules of the athlete's routes with the new model
+        routes = athlete.tracks.filter(activity_type=activity.activity_type)
+        route_ids = list(routes.values_list("id", flat=True))
+        tasks = []
+        for start in range(0, len(route_ids), ROUTE_SCHEDULES_CHUNK_SIZE):
+            end = start + ROUTE_SCHEDULES_CHUNK_SIZE
+            tasks.append(save_route_schedules_task.si(route_ids[start:end], athlete_id))
+
+        if tasks:
+            group(tasks).delay()
+
     return message
 
 
+@shared_task
+def save_route_schedules_task(route_ids, athlete_id):
+    """
+    save the schedules of routes as displayed to the athlete on the route page,
+    so that the prediction model is not run when the athlete visits them.
+
+    Schedules are saved without gear and workout type, which are added when
+    the schedule is displayed, see `Track.calculate_projected_time_schedule`.
+
+    The task is routed to the queue set in the `celery_task_routes` setting.
+    """
+    athlete = Athlete.objects.select_related("user").get(pk=athlete_id)
+    routes = Route.objects.filter(pk__in=route_ids).select_related("activity_type")
+
+    saved_routes = 0
+    for route in routes:
+        try:
+            route.get_base_schedule(route.get_predicted_model(athlete.user))
+        except Exception as error:
+            logger.exception(f"Schedule of route {route.id} not saved: {error}")
+        else:
+            saved_routes += 1
+
+    return f"Schedules saved for {saved_routes} routes of athlete: {athlete}."
+
+
 @shared_task
 def upload_route_to_garmin_task(route_id, athlete_id=None):
     """
@@ -4,6 +4,9 @@ from django import template
 
 register = template.Library()
 
+# display formats of `nice_repr`
+DISPLAY_FORMATS = ["long", "hike"]
+
 
 @register.filter(name="duration")
 def display_timedelta(value, display_format="long"):
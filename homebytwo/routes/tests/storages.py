@@ -0,0 +1,62 @@
+from datetime import datetime
+from io import BytesIO
+
+from django.core.files.base import File
+from django.core.files.storage import Storage
+
+
+class RangeReadFile(File):
+    """
+    seekable file counting the bytes read, like the files of object storages
+    served with HTTP range requests.
+    """
+
+    def __init__(self, content, name, storage):
+        super().__init__(BytesIO(content), name)
+        self.storage = storage
+
+    def read(self, size=-1):
+        data = self.file.read(size)
+        self.storage.bytes_read += len(data)
+        return data
+
+
+class MemoryStorage(Storage):
+    """
+    in-memory stand-in for an S3-compatible object storage: files have no local
+    path and are overwritten when saved with an existing name.
+    """
+
+    def __init__(self):
+        self.files = {}
+        self.bytes_read = 0
+
+    def _open(self, name, mode="rb"):
+        try:
+            content, _ = self.files[name]
+        except KeyError:
+            raise FileNotFoundError(f"File {name} does not exist")
+        return RangeReadFile(content, name, self)
+
+    def _save(self, name, content):
+        content.seek(0)
+        self.files[name] = (content.read(), datetime.now())
+        return name
+
+    def get_available_name(self, name, max_length=None):
+        return name
+
+    def exists(self, name):
+        return name in self.files
+
+    def delete(self, name):
+        self.files.pop(name, None)
+
+    def size(self, name):
+        return len(self.files[name][0])
+
+    def get_modified_time(self, name):
+        return self.files[name][1]
+
+    def url(self, name):
+        return f"memory://{name}"
@@ -4,16 +4,44 @@ from pathlib import Path
 from tempfile import TemporaryDirectory
 
 from django.core.checks import Error
-from django.core.exceptions import SuspiciousFileOperation, ValidationError
+from django.core.exceptions import (
+    ImproperlyConfigured,
+    SuspiciousFileOperation,
+    ValidationError,
+)
 from django.db import connection
 from django.test import TestCase, override_settings
 
+from mock import patch
+from numpy import interp, memmap
+from numpy.random import RandomState
+from pandas import DataFrame, read_hdf
+from pandas.testing import assert_frame_equal
+
 from ...utils.factories import AthleteFactory
-from ..fields import DataFrameField
+from ..dataframe_backends import (
+    BACKEND_CLASSES,
+    MemoryBackend,
+    ParquetBackend,
+    get_backend,
+)
+from ..dataframe_cache import DataFrameCache, dataframe_cache
+from ..dataframe_mmap import shared_columns
+from ..dataframe_storage import StorageBackend
+from ..fields import (
+    DataFrameField,
+    DataFrameFile,
+    downcast_dataframe,
+    get_dataframe_hash,
+)
 from ..models import Route
 from .factories import RouteFactory
+from .storages import MemoryStorage
 
 CURRENT_DIR = Path(__file__).resolve().parent
+FEATHER_BACKEND = "homebytwo.routes.dataframe_backends.FeatherBackend"
+MEMORY_BACKEND = "homebytwo.routes.dataframe_backends.MemoryBackend"
+HDF5_WRITE = "homebytwo.routes.dataframe_backends.HDF5Backend.write"
 
 
 class DataFrameFieldTestCase(TestCase):
@@ -25,6 +53,18 @@ class DataFrameFieldTestCase(TestCase):
         self.assertEqual(field_instance.storage, new_instance.storage)
         self.assertEqual(field_instance.max_length, new_instance.max_length)
 
+    def test_dataframe_field_deconstruct_backend(self):
+        field_instance = DataFrameField(backend=FEATHER_BACKEND, unique_fields=["a"])
+        *_, kwargs = field_instance.deconstruct()
+        assert kwargs["backend"] == FEATHER_BACKEND
+        assert "backend" not in DataFrameField(unique_fields=["a"]).deconstruct()[3]
+
+    def test_dataframe_field_deconstruct_dtypes(self):
+        dtypes = {"altitude": "float32"}
+        field_instance = DataFrameField(dtypes=dtypes, unique_fields=["a"])
+        *_, kwargs = field_instance.deconstruct()
+        assert DataFrameField(**kwargs).dtypes == dtypes
+
     def test_dataframe_field_init(self):
         field_instance = DataFrameField(
             upload_to="foo", storage="bar", max_length=100, unique_fields=["foobar"]
@@ -85,6 +125,371 @@ class DataFrameFieldTestCase(TestCase):
         route.refresh_from_db()
         assert route.data is None
 
+    def test_dataframe_from_db_value_lazy(self):
+        RouteFactory.create_batch(3)
+
+        with patch("homebytwo.routes.dataframe_backends.HDF5Backend.read") as mock_read:
+            routes = list(Route.objects.all())
+            mock_read.assert_not_called()
+
+        assert all(isinstance(route.__dict__["data"], DataFrameFile) for route in routes)
+        assert all(isinstance(route.data, DataFrame) for route in routes)
+        assert all(isinstance(route.__dict__["data"], DataFrame) for route in routes)
+
+    def test_dataframe_from_db_value_deferred(self):
+        RouteFactory()
+        route = Route.objects.defer("data").get()
+
+        assert "data" in route.get_deferred_fields()
+        assert isinstance(route.data, DataFrame)
+
+    def test_dataframe_pre_save_not_loaded(self):
+        RouteFactory()
+        route = Route.objects.get()
+        field = route._meta.get_field("data")
+        full_path = Path(field.get_absolute_path(route.__dict__["data"].filepath))
+        mtime = full_path.stat().st_mtime_ns
+
+        route.save()
+
+        assert isinstance(route.__dict__["data"], DataFrameFile)
+        assert full_path.stat().st_mtime_ns == mtime
+
+    def test_dataframe_load_columns(self):
+        RouteFactory()
+        route = Route.objects.get()
+
+        data = route.load_data(columns=["distance", "altitude"])
+        assert list(data.columns) == ["distance", "altitude"]
+        assert isinstance(route.__dict__["data"], DataFrameFile)
+        assert set(route.__dict__["data"].columns) == {"distance", "altitude"}
+
+        with patch("homebytwo.routes.dataframe_backends.HDF5Backend.read") as mock_read:
+            route.load_data(columns=["altitude"])
+            mock_read.assert_not_called()
+
+        assert_frame_equal(data, route.data[["distance", "altitude"]])
+
+    def test_dataframe_load_columns_loaded(self):
+        route = RouteFactory()
+        data = route.load_data(columns=["distance"])
+        assert list(data.columns) == ["distance"]
+        assert "altitude" in route.data.columns
+
+    def test_dataframe_load_columns_missing_column(self):
+        RouteFactory()
+        route = Route.objects.get()
+        with self.assertRaises(KeyError):
+            route.load_data(columns=["spam"])
+
+    def test_dataframe_load_columns_legacy_file(self):
+        route = RouteFactory()
+        full_path = route._meta.get_field("data").get_absolute_path(
+            route.data.filepath
+        )
+        route.data.to_hdf(full_path, "df", mode="w", format="fixed")
+        route = Route.objects.get()
+
+        data = route.load_data(columns=["altitude"])
+        assert list(data.columns) == ["altitude"]
+        assert_frame_equal(route.data, read_hdf(full_path))
+
+    def test_dataframe_backends_read_write(self):
+        route = RouteFactory.build()
+        data = route.data.assign(gear="None", moving=route.data.distance > 100)
+        with TemporaryDirectory() as directory:
+            for backend_class in BACKEND_CLASSES:
+                backend = backend_class()
+                path = Path(directory, "data" + backend.extension).as_posix()
+                backend.write(data, path)
+
+                assert backend.exists(path)
+                assert_frame_equal(backend.read(path), data)
+                assert_frame_equal(
+                    backend.read(path, ["altitude", "gear"]), data[["altitude", "gear"]]
+                )
+                with self.assertRaises(KeyError):
+                    backend.read(path, ["spam"])
+
+                backend.delete(path)
+                with self.assertRaises(FileNotFoundError):
+                    backend.read(path)
+
+    def test_dataframe_backends_compression(self):
+        route = RouteFactory.build()
+        data = route.data.assign(gear="None")
+        with TemporaryDirectory() as directory:
+            for backend_class in BACKEND_CLASSES:
+                backend = backend_class(compression="zstd")
+                path = Path(directory, "data" + backend.extension).as_posix()
+                backend.save(data, path)
+
+                assert_frame_equal(backend.load(path), data)
+                assert_frame_equal(backend.load(path, ["altitude"]), data[["altitude"]])
+
+    def test_dataframe_backends_attrs(self):
+        route = RouteFactory.build()
+        data = route.data.copy()
+        data.attrs["versions"] = {"gradient": 2}
+        with TemporaryDirectory() as directory:
+            for backend_class in BACKEND_CLASSES:
+                backend = backend_class()
+                path = Path(directory, "data" + backend.extension).as_posix()
+                backend.save(data, path)
+
+                assert backend.load(path).attrs == {"versions": {"gradient": 2}}
+                assert backend.load(path, ["altitude"]).attrs == data.attrs
+
+    def test_dataframe_attrs_change_hash(self):
+        route = RouteFactory.build()
+        data = route.data.copy()
+        content_hash = get_dataframe_hash(data)
+        data.attrs["versions"] = {"gradient": 2}
+        assert get_dataframe_hash(data) != content_hash
+
+    def test_dataframe_downcast_dtypes(self):
+        route = RouteFactory()
+        assert route.data.altitude.dtype == "float32"
+
+        data = Route.objects.get().data
+        assert data.distance.dtype == "float64"
+        assert_frame_equal(data, route.data)
+
+    def test_downcast_dataframe(self):
+        data = DataFrame({"time": [0.0, 1.0, None], "moving": [1, 0, 1]})
+        data = downcast_dataframe(data, {"time": "int32", "moving": "bool"})
+        assert data.time.dtype == "float64"
+        assert data.moving.dtype == "bool"
+
+    @override_settings(DATAFRAME_BACKEND=FEATHER_BACKEND)
+    def test_dataframe_backend_setting(self):
+        route = RouteFactory()
+        data = route.data
+        assert route.data.filepath.endswith(".feather")
+
+        route.refresh_from_db()
+        assert_frame_equal(route.load_data(columns=["altitude"]), data[["altitude"]])
+        assert_frame_equal(route.data, data)
+
+    @override_settings(DATAFRAME_BACKEND=FEATHER_BACKEND)
+    def test_dataframe_backend_setting_existing_file(self):
+        with override_settings(DATAFRAME_BACKEND=MEMORY_BACKEND):
+            route = RouteFactory()
+        route.refresh_from_db()
+        assert route.data is not None
+        route.save()
+
+        assert route.data.filepath.endswith(".mem")
+        full_path = route._meta.get_field("data").get_absolute_path(route.data.filepath)
+        backend = get_backend(MEMORY_BACKEND)
+        self.addCleanup(backend.files.clear)
+        assert full_path in backend.files
+        assert not Path(full_path).exists()
+
+    def test_memory_backend_files(self):
+        data = RouteFactory.build().data
+        backend = MemoryBackend()
+        backend.save(data, "data.mem")
+
+        assert backend.exists("data.mem")
+        assert not MemoryBackend().exists("data.mem")
+
+    def test_dataframe_cache_hit(self):
+        RouteFactory()
+        route = Route.objects.get()
+        data = route.data
+
+        with patch("homebytwo.routes.dataframe_backends.HDF5Backend.read") as mock_read:
+            route = Route.objects.get()
+            altitude = route.load_data(columns=["altitude"])
+            assert_frame_equal(route.data, data)
+            assert_frame_equal(altitude, data[["altitude"]])
+            mock_read.assert_not_called()
+
+    def test_dataframe_cache_returns_copies(self):
+        RouteFactory()
+        route = Route.objects.get()
+        route.data["altitude"] = 0
+        route.data["schedule"] = 1
+
+        route = Route.objects.get()
+        assert "schedule" not in route.data.columns
+        assert route.data.altitude.any()
+
+    def test_dataframe_cache_invalidated_on_save(self):
+        route = RouteFactory()
+        Route.objects.get().data
+
+        route.data = route.data.assign(altitude=1)
+        route.save()
+
+        assert (Route.objects.get().data.altitude == 1).all()
+
+    def test_dataframe_cache_projected_then_full_read(self):
+        route = RouteFactory()
+        data = route.data
+        dataframe_cache.clear()
+
+        field = Route._meta.get_field("data")
+        projected = field.retrieve_dataframe(data.filepath, ["distance", "altitude"])
+        assert list(projected.columns) == ["distance", "altitude"]
+
+        full = field.retrieve_dataframe(data.filepath)
+        assert_frame_equal(full, data)
+        assert full.content_hash == get_dataframe_hash(data)
+
+        cache = DataFrameCache()
+        cache.set("a.h5", 1, data[["distance"]], complete=False)
+        assert cache.get("a.h5", 1) is None
+        assert cache.get("a.h5", 1, ["distance"]) is not None
+
+    def test_dataframe_cache_lru_eviction(self):
+        cache = DataFrameCache()
+        data = DataFrame({"distance": range(100)})
+        size = data.memory_usage(deep=True).sum()
+
+        with override_settings(DATAFRAME_CACHE_MAX_BYTES=2 * size):
+            cache.set("a.h5", 1, data)
+            cache.set("b.h5", 1, data)
+            assert cache.get("a.h5", 1) is not None
+            cache.set("c.h5", 1, data)
+
+            assert cache.get("b.h5", 1) is None
+            assert cache.get("a.h5", 1) is not None
+            assert cache.get("a.h5", 2) is None
+            assert list(cache.entries) == ["c.h5"]
+
+    @override_settings(DATAFRAME_CACHE_MAX_BYTES=0)
+    def test_dataframe_cache_disabled(self):
+        dataframe_cache.clear()
+        RouteFactory()
+        assert Route.objects.get().data is not None
+        assert not dataframe_cache.entries
+
+    def test_dataframe_load_arrays(self):
+        route = RouteFactory()
+        arrays = route.load_data_arrays(["distance", "altitude"])
+        assert list(arrays) == ["distance", "altitude"]
+        assert (arrays["altitude"] == route.data.altitude.to_numpy()).all()
+
+    def test_dataframe_load_arrays_shared(self):
+        RouteFactory()
+        with TemporaryDirectory() as mmap_root:
+            with override_settings(DATAFRAME_MMAP_ROOT=mmap_root):
+                data = Route.objects.get().data
+                arrays = Route.objects.get().load_data_arrays(["distance", "altitude"])
+                assert not isinstance(arrays["altitude"], memmap)
+
+                route = Route.objects.get()
+                arrays = route.load_data_arrays(["distance", "altitude"])
+                assert isinstance(arrays["altitude"], memmap)
+                assert not arrays["altitude"].flags.writeable
+                assert (arrays["altitude"] == data.altitude.to_numpy()).all()
+                assert isinstance(route.__dict__["data"], DataFrameFile)
+                assert route.get_data(0.5, "altitude") == interp(
+                    0.5 * route.total_distance, data.distance, data.altitude
+                )
+
+    def test_dataframe_load_arrays_shared_invalidated_on_save(self):
+        route = RouteFactory()
+        field = route._meta.get_field("data")
+        full_path = field.get_absolute_path(route.data.filepath)
+
+        with TemporaryDirectory() as mmap_root:
+            with override_settings(DATAFRAME_MMAP_ROOT=mmap_root):
+                Route.objects.get().load_data_arrays(["altitude"])
+                assert shared_columns.get_directory(full_path).exists()
+
+                route.save()
+                assert not shared_columns.get_directory(full_path).exists()
+
+    def test_dataframe_save_unchanged(self):
+        RouteFactory()
+        route = Route.objects.get()
+        route.data
+
+        with patch(HDF5_WRITE) as mock_write:
+            route.save()
+            mock_write.assert_not_called()
+
+            route.data["altitude"] += 1
+            route.save()
+            mock_write.assert_called_once()
+
+    def test_dataframe_save_unchanged_downcast(self):
+        RouteFactory()
+        route = Route.objects.get()
+        filepath = route.data.filepath
+        route.data["altitude"] = route.data.altitude.astype("float64")
+
+        with patch(HDF5_WRITE) as mock_write:
+            route.save()
+            mock_write.assert_not_called()
+
+        assert route.data.altitude.dtype == "float32"
+        assert route.data.filepath == filepath
+
+    def test_dataframe_save_unchanged_missing_file(self):
+        route = RouteFactory()
+        field = route._meta.get_field("data")
+        full_path = Path(field.get_absolute_path(route.data.filepath))
+        full_path.unlink()
+
+        route.save()
+        assert full_path.exists()
+
+    def test_dataframe_save_new_dataframe(self):
+        route = RouteFactory()
+        route.data = route.data.copy()
+
+        with patch(HDF5_WRITE) as mock_write:
+            route.save()
+            mock_write.assert_called_once()
+
+    @override_settings(DATAFRAME_CONTENT_ADDRESSED=True)
+    def test_dataframe_content_addressed(self):
+        route, other_route = RouteFactory.create_batch(2)
+        assert route.data.filepath == other_route.data.filepath
+        assert route.data.filepath.startswith("dataframes/")
+
+        with patch(HDF5_WRITE) as mock_write:
+            RouteFactory()
+            mock_write.assert_not_called()
+
+        altitude = other_route.data.altitude + 1
+        other_route.data = other_route.data.assign(altitude=altitude)
+        other_route.save()
+        assert other_route.data.filepath != route.data.filepath
+
+        route.refresh_from_db()
+        assert (route.data.altitude + 1 == other_route.data.altitude).all()
+
+    @override_settings(DATAFRAME_CONTENT_ADDRESSED=True)
+    def test_dataframe_content_addressed_delete_unreferenced_file(self):
+        route, other_route = RouteFactory.create_batch(2)
+        field = route._meta.get_field("data")
+        filepath = route.data.filepath
+        full_path = Path(field.get_absolute_path(filepath))
+
+        with patch("homebytwo.routes.fields.UNREFERENCED_FILE_GRACE_PERIOD", 0):
+            route.delete()
+            field.delete_unreferenced_file(filepath)
+            assert full_path.exists()
+
+            other_route.delete()
+            field.delete_unreferenced_file(filepath)
+            assert not full_path.exists()
+
+    @override_settings(DATAFRAME_CONTENT_ADDRESSED=True)
+    def test_dataframe_content_addressed_delete_recent_file(self):
+        route = RouteFactory()
+        field = route._meta.get_field("data")
+        filepath = route.data.filepath
+        route.delete()
+
+        field.delete_unreferenced_file(filepath)
+        assert Path(field.get_absolute_path(filepath)).exists()
+
     def test_dataframe_from_db_value_missing_file(self):
         route = RouteFactory()
 
@@ -123,7 +528,7 @@ class DataFrameFieldTestCase(TestCase):
 
         route.refresh_from_db()
         assert route.data is None
-        assert not Path(full_path).exists()
+        assert Path(full_path).exists()
 
     def test_dataframe_from_db_value_corrupted_hdf5(self):
         route = RouteFactory()
@@ -136,7 +541,55 @@ class DataFrameFieldTestCase(TestCase):
 
         route.refresh_from_db()
         assert route.data is None
-        assert not Path(full_path).exists()
+        assert Path(full_path).exists()
+
+    def test_dataframe_from_db_value_checksum_mismatch(self):
+        route = RouteFactory()
+        field = route._meta.get_field("data")
+        full_path = Path(field.get_absolute_path(route.data.filepath))
+        assert Path(f"{full_path}.checksum").exists()
+
+        with full_path.open("r+b") as file:
+            file.seek(-8, 2)
+            file.write(b"spamspam")
+
+        route.refresh_from_db()
+        assert route.data is None
+        assert full_path.exists()
+
+    def test_dataframe_load_columns_checks_size(self):
+        route = RouteFactory()
+        field = route._meta.get_field("data")
+        full_path = field.get_absolute_path(route.data.filepath)
+        backend = field.get_backend(full_path)
+
+        with patch(
+            "homebytwo.routes.dataframe_backends.get_file_checksum"
+        ) as get_checksum:
+            data = backend.load(full_path, ["altitude"])
+            get_checksum.assert_not_called()
+        assert_frame_equal(data, route.data[["altitude"]], check_dtype=False)
+
+        with open(full_path, "ab") as file:
+            file.write(b"spam")
+        with self.assertRaises(IOError):
+            backend.load(full_path, ["altitude"])
+
+    def test_dataframe_save_dataframe_to_file_failed_write(self):
+        route = RouteFactory()
+        field = route._meta.get_field("data")
+        full_path = Path(field.get_absolute_path(route.data.filepath))
+        data = route.data.copy()
+
+        route.data = route.data.assign(altitude=route.data.altitude + 1)
+        with patch(HDF5_WRITE, side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                route.save()
+
+        # no temporary file is left behind and the previous file is intact
+        assert not any(path.name.startswith(".") for path in full_path.parent.iterdir())
+        route.refresh_from_db()
+        assert_frame_equal(route.data, data)
 
     def test_dataframe_pre_save_not_a_dataframe(self):
         route = RouteFactory()
@@ -191,3 +644,121 @@ class DataFrameFieldTestCase(TestCase):
         route.save()
 
         self.assertEqual(route.data.filepath, filepath)
+
+    def test_dataframe_save_dataframe_to_file_shared_object(self):
+        route = RouteFactory()
+        other_route = RouteFactory(data=route.data)
+
+        assert route.data is other_route.data
+        assert Route.objects.get(pk=route.pk).data.filepath != (
+            Route.objects.get(pk=other_route.pk).data.filepath
+        )
+
+    def test_dataframe_prefetch_dataframes(self):
+        RouteFactory.create_batch(3)
+        routes = list(Route.objects.prefetch_dataframes("data", workers=2))
+
+        assert all(isinstance(route.__dict__["data"], DataFrame) for route in routes)
+        with patch("homebytwo.routes.dataframe_backends.HDF5Backend.read") as mock_read:
+            assert all(route.data is not None for route in routes)
+            mock_read.assert_not_called()
+
+    def test_dataframe_prefetch_dataframes_columns(self):
+        RouteFactory.create_batch(2)
+        routes = Route.objects.prefetch_dataframes("data", columns=["altitude"])
+
+        for route in routes.order_by("pk")[:2]:
+            assert isinstance(route.__dict__["data"], DataFrameFile)
+            assert set(route.__dict__["data"].columns) == {"altitude"}
+
+    def test_dataframe_prefetch_dataframes_not_dataframe_field(self):
+        with self.assertRaises(ValueError):
+            Route.objects.prefetch_dataframes("name")
+
+    def test_dataframe_object_storage(self):
+        storage = MemoryStorage()
+        field = Route._meta.get_field("data")
+        with patch.object(field, "storage", storage):
+            route = RouteFactory()
+            assert route.data.filepath in storage.files
+
+            dataframe_cache.clear()
+            assert_frame_equal(Route.objects.get().data, route.data)
+
+            route.data = route.data.assign(altitude=1)
+            route.save()
+            dataframe_cache.clear()
+            assert (Route.objects.get().data.altitude == 1).all()
+
+    def test_dataframe_object_storage_range_reads(self):
+        storage = MemoryStorage()
+        backend = StorageBackend(ParquetBackend(), storage)
+        data = DataFrame(RandomState(0).rand(20000, 4), columns=list("abcd"))
+        backend.save(data, "data/data.parquet")
+
+        with patch("homebytwo.routes.dataframe_storage.RANGE_READ_MIN_SIZE", 0):
+            assert_frame_equal(backend.load("data/data.parquet", ["a"]), data[["a"]])
+        assert storage.bytes_read < storage.size("data/data.parquet")
+
+    def test_dataframe_object_storage_local_cache(self):
+        storage = MemoryStorage()
+        backend = StorageBackend(ParquetBackend(), storage)
+        data = DataFrame({"altitude": [1.0, 2.0, 3.0]})
+
+        with TemporaryDirectory() as directory:
+            with override_settings(DATAFRAME_STORAGE_CACHE_ROOT=directory):
+                backend.save(data, "data/data.parquet")
+                assert_frame_equal(backend.load("data/data.parquet"), data)
+                assert storage.bytes_read == 0
+
+                backend.delete("data/data.parquet")
+                assert not any(Path(directory).iterdir())
+                with self.assertRaises(FileNotFoundError):
+                    backend.load("data/data.parquet")
+
+    def test_dataframe_object_storage_no_overwrite(self):
+        storage = MemoryStorage()
+        backend = StorageBackend(ParquetBackend(), storage)
+        data = DataFrame({"altitude": [1.0, 2.0, 3.0]})
+        backend.save(data, "data/data.parquet")
+
+        with patch.object(
+            storage, "get_available_name", return_value="data/data_1.parquet"
+        ):
+            with self.assertRaises(ImproperlyConfigured):
+                backend.save(data.assign(altitude=0.0), "data/data.parquet")
+
+        # the existing file was never deleted
+        assert list(storage.files) == ["data/data.parquet"]
+        assert_frame_equal(backend.load("data/data.parquet"), data)
+
+    def test_dataframe_object_storage_load_version(self):
+        storage = MemoryStorage()
+        backend = StorageBackend(ParquetBackend(), storage)
+        data = DataFrame({"altitude": [1.0, 2.0, 3.0]})
+        backend.save(data, "data/data.parquet")
+        version = backend.get_version("data/data.parquet")
+
+        with patch.object(storage, "size") as size:
+            loaded_data = backend.load("data/data.parquet", version=version)
+            size.assert_not_called()
+        assert_frame_equal(loaded_data, data)
+
+    def test_dataframe_object_storage_touch(self):
+        storage = MemoryStorage()
+        backend = StorageBackend(ParquetBackend(), storage)
+        backend.save(DataFrame({"altitude": [1.0]}), "data/data.parquet")
+        modified_time = backend.get_modified_time("data/data.parquet")
+
+        backend.touch("data/data.parquet")
+        assert storage.bytes_read == 0
+        assert backend.get_modified_time("data/data.parquet") >= modified_time
+        assert storage.size("data/data.parquet.touch") == 0
+
+        backend.delete("data/data.parquet")
+        assert not storage.files
+
+    def test_dataframe_object_storage_suspicious_name(self):
+        with patch.object(Route._meta.get_field("data"), "storage", MemoryStorage()):
+            with self.assertRaises(SuspiciousFileOperation):
+                Route._meta.get_field("data").get_absolute_path("../data.h5")
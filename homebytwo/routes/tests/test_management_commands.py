@@ -1,9 +1,11 @@
 from io import StringIO
+from pathlib import Path
 
 from django.core.management import call_command
 
 import pytest
 from pandas import DataFrame
+from pandas.testing import assert_frame_equal
 
 from homebytwo.importers.tests.factories import (
     StravaRouteFactory,
@@ -172,3 +174,120 @@ def test_train_activity_types_limit():
     ActivityFactory(activity_type__name="Run")
     assert trained_message.format(1) in call_train_activity_types("Run", "--limit", 1)
     assert not ActivityType.objects.get(name="Run").model_score == 0.0
+
+
+###########################
+# migrate_dataframe_files #
+###########################
+
+FEATHER_BACKEND = "homebytwo.routes.dataframe_backends.FeatherBackend"
+
+
+def call_migrate_dataframe_files(*args, **kwargs):
+    out = StringIO()
+    call_command(
+        "migrate_dataframe_files",
+        *args,
+        stdout=out,
+        stderr=StringIO(),
+        **kwargs,
+    )
+    return out.getvalue()
+
+
+@pytest.mark.django_db
+def test_migrate_dataframe_files():
+    route = RouteFactory()
+    activity = ActivityFactory()
+    route_data, activity_streams = route.data, activity.streams
+    field = route._meta.get_field("data")
+    old_path = Path(field.get_absolute_path(route.data.filepath))
+
+    out = call_migrate_dataframe_files("--backend", FEATHER_BACKEND)
+    assert "Converted 2 files and skipped 0." in out
+    assert not old_path.exists()
+
+    route.refresh_from_db()
+    activity.refresh_from_db()
+    assert route.data.filepath.endswith(".feather")
+    assert_frame_equal(route.data, route_data)
+    assert_frame_equal(activity.streams, activity_streams)
+
+    out = call_migrate_dataframe_files("--backend", FEATHER_BACKEND)
+    assert "Converted 0 files and skipped 2." in out
+
+
+@pytest.mark.django_db
+def test_migrate_dataframe_files_dry_run():
+    route = RouteFactory()
+    filepath = route.data.filepath
+
+    out = call_migrate_dataframe_files("--backend", FEATHER_BACKEND, "--dry-run")
+    assert "Would convert 1 files and skipped 0." in out
+
+    route.refresh_from_db()
+    assert route.data.filepath == filepath
+
+
+@pytest.mark.django_db
+def test_migrate_dataframe_files_rewrite():
+    route = RouteFactory()
+    filepath = route.data.filepath
+
+    out = call_migrate_dataframe_files("--rewrite")
+    assert "Converted 1 files and skipped 0." in out
+
+    route.refresh_from_db()
+    assert route.data.filepath == filepath
+
+
+################################
+# benchmark_dataframe_backends #
+################################
+
+
+@pytest.mark.django_db
+def test_benchmark_dataframe_backends():
+    RouteFactory()
+    out = StringIO()
+    call_command("benchmark_dataframe_backends", "--repeat", 1, stdout=out)
+    for backend in ["HDF5Backend", "FeatherBackend", "ParquetBackend"]:
+        assert backend in out.getvalue()
+    assert "No activity streams to benchmark." in out.getvalue()
+
+
+@pytest.mark.django_db
+def test_migrate_dataframe_files_content_addressed():
+    route, other_route = RouteFactory.create_batch(2)
+    data = route.data
+    field = route._meta.get_field("data")
+    old_paths = [
+        Path(field.get_absolute_path(r.data.filepath)) for r in [route, other_route]
+    ]
+
+    out = call_migrate_dataframe_files("--content-addressed")
+    assert "Converted 2 files and skipped 0." in out
+    assert not any(path.exists() for path in old_paths)
+
+    route.refresh_from_db()
+    other_route.refresh_from_db()
+    assert route.data.filepath == other_route.data.filepath
+    assert route.data.filepath.startswith("dataframes/")
+    assert_frame_equal(route.data, data)
+
+    out = call_migrate_dataframe_files("--content-addressed")
+    assert "Converted 0 files and skipped 2." in out
+
+
+############################
+# report_dataframe_storage #
+############################
+
+
+@pytest.mark.django_db
+def test_report_dataframe_storage():
+    RouteFactory()
+    out = StringIO()
+    call_command("report_dataframe_storage", "--compression", "zstd", stdout=out)
+    assert "Route.data" in out.getvalue()
+    assert "No files found for Activity.streams." in out.getvalue()
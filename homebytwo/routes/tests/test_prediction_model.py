@@ -2,6 +2,10 @@ from django.core.exceptions import FieldError
 from django.urls import reverse
 
 import pytest
+from numpy import array
+from numpy.random import default_rng
+from numpy.testing import assert_allclose
+from pandas import DataFrame
 
 from ..forms import ActivityPerformanceForm
 from ..models import ActivityType
@@ -114,6 +118,94 @@ def test_prediction_model_with_custom_parameters():
     assert prediction_model.polynomial_columns == []
 
 
+def test_prediction_model_gradient_curvature():
+    prediction_model = PredictionModel(
+        regression_intercept=0.36,
+        regression_coefficients=array([0.0, 0.0, 0.0, 0.075, 0.0004, 0.0, 0.0]),
+        onehot_encoder_categories=[["None"], ["None"]],
+    )
+
+    assert prediction_model.get_gradient_curvature() == pytest.approx(0.0004)
+
+
+def test_prediction_model_predict_matches_pipeline():
+    random = default_rng(0)
+    size = 500
+    data = DataFrame(
+        {
+            "gradient": random.normal(0, 10, size),
+            "total_elevation_gain": random.uniform(0, 2000, size),
+            "total_distance": random.uniform(0, 40000, size),
+            "gear": random.choice(["g1", "g2", "g3"], size),
+            "workout_type": random.choice(["None", "race"], size),
+        }
+    )
+    pace = 0.3 + 0.01 * data.gradient + 0.0004 * data.gradient ** 2
+    prediction_model = PredictionModel()
+    prediction_model.train(y=pace + random.normal(0, 0.05, size), x=data)
+
+    # unknown categories are ignored
+    data.loc[::7, "gear"] = "unknown"
+    assert_allclose(
+        prediction_model.predict(data),
+        prediction_model.pipeline.predict(data),
+        rtol=1e-12,
+    )
+
+    restored_model = PredictionModel(
+        regression_intercept=prediction_model.regression_intercept,
+        regression_coefficients=prediction_model.regression_coefficients,
+        onehot_encoder_categories=prediction_model.onehot_encoder_categories,
+    )
+    assert restored_model._pipeline is None
+    assert_allclose(
+        restored_model.predict(data),
+        restored_model.pipeline.predict(data),
+        rtol=1e-12,
+    )
+
+    # categories add a constant to the pace predicted from numerical columns
+    row = data.iloc[:1]
+    offset = restored_model.get_categorical_offset(
+        {"gear": row.gear.iloc[0], "workout_type": row.workout_type.iloc[0]}
+    )
+    assert restored_model.predict_numerical(row)[0] + offset == pytest.approx(
+        restored_model.predict(row)[0]
+    )
+    assert restored_model.get_categorical_offset({"gear": "unknown"}) == 0
+
+
+def test_prediction_model_predict_numerical_gradient_tolerance():
+    prediction_model = PredictionModel(
+        regression_intercept=0.36,
+        regression_coefficients=array([0.0, 0.0, 0.0, 0.075, 0.0004, 0.001, 0.0]),
+        onehot_encoder_categories=[["None"], ["None"]],
+    )
+    size = 20000
+    data = DataFrame(
+        {
+            "gradient": default_rng(0).normal(0, 15, size),
+            "total_elevation_gain": 1500.0,
+            "total_distance": 40000.0,
+        }
+    )
+    exact_pace = prediction_model.predict_numerical(data)
+
+    # the pace error is bounded by the derivative of the pace times the tolerance
+    tolerance = 0.05
+    pace = prediction_model.predict_numerical(data, gradient_tolerance=tolerance)
+    max_derivative = 0.075 + 2 * 0.0004 * (data.gradient.abs().max() + tolerance)
+    assert abs(pace - exact_pace).max() <= max_derivative * tolerance
+    assert abs(pace - exact_pace).max() > 0
+
+    # data with varying route constants is predicted exactly
+    data.loc[::2, "total_distance"] = 20000.0
+    assert_allclose(
+        prediction_model.predict_numerical(data, gradient_tolerance=tolerance),
+        prediction_model.predict_numerical(data),
+    )
+
+
 def test_train_prediction_model(athlete):
     activity_type = ActivityTypeFactory()
     performance = ActivityPerformanceFactory(
@@ -127,6 +219,27 @@ def test_train_prediction_model(athlete):
     assert performance.workout_type_categories == [activity.get_workout_type_display()]
 
 
+def test_get_prediction_model_cached(athlete):
+    activity_type = ActivityTypeFactory()
+    performance = ActivityPerformanceFactory(
+        athlete=athlete, activity_type=activity_type
+    )
+    prediction_model = performance.get_prediction_model()
+    assert performance.get_prediction_model() is prediction_model
+    assert ActivityPerformance.objects.get().get_prediction_model() is prediction_model
+
+    # parameters saved by another process
+    ActivityPerformance.objects.update(flat_parameter=0.5)
+    saved_performance = ActivityPerformance.objects.get()
+    assert saved_performance.get_prediction_model() is not prediction_model
+
+    # retraining the model
+    ActivityFactory(athlete=athlete, activity_type=activity_type)
+    prediction_model = saved_performance.get_prediction_model()
+    saved_performance.train_prediction_model()
+    assert saved_performance.get_prediction_model() is not prediction_model
+
+
 def test_train_prediction_model_data_no_data(athlete):
     activity_performance = ActivityPerformanceFactory(athlete=athlete)
     activity_type = activity_performance.activity_type.name
@@ -188,15 +301,16 @@ def test_get_activity_training_data(athlete):
         athlete=athlete, activity_type=activity_performance.activity_type
     )
     activity_data = activity.get_training_data()
-    assert activity_data.shape == (99, 15)
+    assert activity_data.shape == (99, 14)
+    assert "moving" not in activity_data.columns
 
 
 def test_track_return_prediction_model(athlete):
     route = RouteFactory()
     route.calculate_projected_time_schedule(athlete.user)
 
-    assert "schedule" in route.data.columns
-    assert "pace" in route.data.columns
+    assert "schedule" in route.schedule.columns
+    assert "pace" in route.schedule.columns
 
 
 def test_activity_performance_form_no_choices(athlete):
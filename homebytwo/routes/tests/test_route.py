@@ -1,19 +1,24 @@
 from datetime import timedelta
-from os import urandom
+from os import environ, urandom
 from pathlib import Path
+from time import perf_counter
 from uuid import uuid4
 
 from django.conf import settings
 from django.contrib.gis.geos import LineString, Point
 from django.contrib.gis.measure import Distance
 from django.core.management import CommandError, call_command
+from django.db import connection
 from django.forms.models import model_to_dict
 from django.shortcuts import resolve_url
+from django.test.utils import CaptureQueriesContext
 from django.urls import resolve, reverse
 from django.utils.six import StringIO
 
 import pytest
+from numpy import array, percentile
 from pandas import DataFrame
+from pandas.testing import assert_series_equal
 from pytest_django.asserts import assertContains, assertRedirects
 
 from ...utils.factories import AthleteFactory
@@ -21,7 +26,15 @@ from ...utils.tests import create_checkpoints_from_geom, create_route_with_check
 from ..fields import DataFrameField
 from ..forms import RouteForm
 from ..models import Route
+from ..models.track import CHECKPOINT_COLUMNS, TRACK_DATA_PIPELINE
+from ..prediction_model import PredictionModel
 from ..templatetags.duration import base_round, display_timedelta, nice_repr
+from ..utils import (
+    create_line,
+    get_coordinates,
+    get_simplified_profile_mask,
+    resample_profile,
+)
 from .factories import (
     ActivityFactory,
     ActivityPerformanceFactory,
@@ -30,6 +43,14 @@ from .factories import (
     RouteFactory,
 )
 
+# maximum 95th percentile in seconds of the response time of routes:schedule
+SCHEDULE_LATENCY_BUDGET = 0.05
+
+# response times depend on the machine: run the benchmarks with BENCHMARK=1
+benchmark = pytest.mark.skipif(
+    not environ.get("BENCHMARK"), reason="set BENCHMARK=1 to run benchmarks"
+)
+
 ###############
 # model Route #
 ###############
@@ -125,6 +146,37 @@ def test_get_distance_data():
 
     assert isinstance(point_altitude, Distance)
     assert point_altitude.m == 500
+    assert route.get_distance_data(0.5, "distance").m == 500
+
+
+def test_annotate_checkpoints(athlete, mocker):
+    route = create_route_with_checkpoints(number_of_checkpoints=5, athlete=athlete)
+    route.calculate_projected_time_schedule(athlete.user)
+    columns = CHECKPOINT_COLUMNS + ["schedule"]
+    checkpoints = route.checkpoint_set.all()
+    expected = [
+        route.get_data(checkpoint.line_location, column)
+        for checkpoint in checkpoints
+        for column in columns
+    ]
+
+    load_data = mocker.spy(route, "load_data_arrays")
+    load_profile = mocker.spy(route, "load_profile_arrays")
+    checkpoints = route.annotate_checkpoints(checkpoints, columns=columns)
+
+    # each source of the columns is read once for all checkpoints
+    assert load_data.call_count <= 1 and load_profile.call_count <= 1
+    assert [
+        checkpoint.get_route_data(column)
+        for checkpoint in checkpoints
+        for column in columns
+    ] == pytest.approx(expected)
+
+    checkpoint = checkpoints[0]
+    assert checkpoint.altitude_on_route.m == pytest.approx(expected[0])
+    assert checkpoint.distance_from_start.m == pytest.approx(expected[1])
+    assert checkpoint.cumulative_elevation_loss.m >= 0
+    assert load_data.call_count <= 1 and load_profile.call_count <= 1
 
 
 def test_get_start_and_end_places(athlete):
@@ -298,6 +350,42 @@ def test_calculate_distances_impossible():
         route.calculate_step_distances(min_distance=1, commit=False)
 
 
+def test_calculate_step_distances_mismatching_geom():
+    data = DataFrame({"altitude": [0, 1, 2], "distance": [0, 1, 2]})
+    geom = LineString((0, 0), (0, 1))
+    route = RouteFactory.build(data=data, geom=geom)
+    with pytest.raises(ValueError):
+        route.calculate_step_distances(min_distance=1, commit=False)
+
+
+def test_get_coordinates_create_line():
+    geom = LineString((0, 0), (0, 1.5), (2, 3), srid=3857)
+    coords = get_coordinates(geom)
+    assert coords.tolist() == [[0, 0], [0, 1.5], [2, 3]]
+
+    line = create_line(coords[[True, False, True]], srid=geom.srid)
+    assert line.equals(LineString((0, 0), (2, 3)))
+    assert line.srid == 3857
+
+    with pytest.raises(ValueError):
+        create_line(coords[:1])
+
+
+def test_get_simplified_profile_mask():
+    distance = [0, 1, 2, 3, 4]
+    assert get_simplified_profile_mask(distance, [0, 1, 2, 3, 4], 0).tolist() == [
+        True,
+        False,
+        False,
+        False,
+        True,
+    ]
+
+    altitude = [0, 1, 0, 1, 0]
+    assert get_simplified_profile_mask(distance, altitude, 0).all()
+    assert get_simplified_profile_mask(distance, altitude, 1e6).sum() == 2
+
+
 def test_calculate_gradients():
     data = DataFrame(
         {
@@ -347,6 +435,22 @@ def test_calculate_gradients_commit(athlete):
     assert len(saved_route.data.gradient) == len(saved_route.geom)
 
 
+def test_calculate_gradients_bad_stretch():
+    geom = LineString([(0, x) for x in range(9)])
+    data = DataFrame(
+        {
+            "altitude": [0, 1, 2, 12, 13, 14, 4, 5, 6],
+            "distance": [0, 1, 2, 3, 4, 5, 6, 7, 8],
+        }
+    )
+    route = RouteFactory.build(data=data, geom=geom)
+    route.calculate_gradients(max_gradient=100, commit=False)
+
+    # the offending rows are dropped together, until no bad gradient remains
+    assert route.data.altitude.to_list() == [0, 1, 2]
+    assert len(route.data.gradient) == len(route.geom)
+
+
 def test_calculate_gradients_impossible():
     geom = LineString((0, 0), (0, 1), (0, 2), (0, 3), (0, 4))
     data = DataFrame(
@@ -474,6 +578,95 @@ def test_update_permanent_track_data_bad_route():
         route.update_permanent_track_data(commit=False)
 
 
+def test_update_permanent_track_data_stale_stage(mocker):
+    data = DataFrame(
+        {
+            "distance": list(range(10)),
+            "altitude": list(range(10)),
+        }
+    )
+    geom = LineString([(lng, 0) for lng in range(10)])
+    route = RouteFactory.build(data=data, geom=geom)
+    route.update_permanent_track_data(commit=False)
+    assert route.data.attrs["versions"]["gradient"] == 1
+
+    # a new version of the gradient calculation only updates the stale stages
+    gradient_stage = TRACK_DATA_PIPELINE.stages[1]
+    mocker.patch.object(gradient_stage, "version", 2)
+    calculate_step_distances = mocker.patch.object(Route, "calculate_step_distances")
+    route.update_permanent_track_data(commit=False)
+
+    calculate_step_distances.assert_not_called()
+    assert route.data.attrs["versions"]["gradient"] == 2
+    assert not TRACK_DATA_PIPELINE.get_stale_stages(route.data)
+
+
+def test_resample_profile():
+    distance, altitude = resample_profile([0, 10, 25], [0, 10, 40], step=10)
+    assert distance.tolist() == [0, 10, 20, 25]
+    assert altitude.tolist() == [0, 10, 30, 40]
+
+
+def test_update_permanent_track_data_profile(athlete, settings):
+    settings.TRACK_PROFILE_STEP = 25
+    data = DataFrame(
+        {
+            "distance": [distance * 3 for distance in range(100)],
+            "altitude": list(range(100)),
+        }
+    )
+    geom = LineString([(lng, 0) for lng in data.distance.to_list()])
+    route = RouteFactory(
+        name="profile", athlete=athlete, data=data, geom=geom, total_distance=297
+    )
+    route.update_permanent_track_data()
+
+    saved_route = Route.objects.get(name="profile", athlete=athlete)
+    assert saved_route.has_profile()
+    assert saved_route.profile.attrs == {"step": 25}
+    assert saved_route.profile.distance.to_list()[:3] == [0, 25, 50]
+    assert saved_route.profile.distance.iloc[-1] == 297
+    assert saved_route.get_distance_data(0.5, "altitude").m == pytest.approx(49.5)
+
+
+def create_route_with_profile(athlete, settings):
+    settings.TRACK_PROFILE_STEP = 25
+    data = DataFrame(
+        {
+            "distance": [distance * 3 for distance in range(100)],
+            "altitude": list(range(100)),
+        }
+    )
+    geom = LineString([(lng, 0) for lng in data.distance.to_list()])
+    route = RouteFactory(athlete=athlete, data=data, geom=geom, total_distance=297)
+    route.update_permanent_track_data()
+    return Route.objects.get(pk=route.pk)
+
+
+def test_profile_cleared_on_data_change(athlete, settings):
+    route = create_route_with_profile(athlete, settings)
+    route.save(update_fields=["name"])
+    route.save()
+    assert Route.objects.get(pk=route.pk).has_profile()
+
+    route.data = route.data.assign(altitude=0.0)
+    route.save(update_fields=["data"])
+
+    saved_route = Route.objects.get(pk=route.pk)
+    assert not saved_route.has_profile()
+    assert saved_route.get_distance_data(0.5, "altitude").m == 0
+
+
+def test_profile_file_missing(athlete, settings):
+    route = create_route_with_profile(athlete, settings)
+    field = route._meta.get_field("profile")
+    Path(field.get_absolute_path(route.profile.filepath)).unlink()
+
+    route = Route.objects.get(pk=route.pk)
+    assert route.has_profile()
+    assert route.get_distance_data(0.5, "altitude").m == pytest.approx(49.5)
+
+
 def test_calculate_projected_time_schedule(athlete):
     route = RouteFactory()
     activity_performance = ActivityPerformanceFactory(
@@ -486,8 +679,9 @@ def test_calculate_projected_time_schedule(athlete):
         workout_type=activity_performance.workout_type_categories[-1],
     )
 
-    assert "gear" in route.data.columns and "workout_type" in route.data.columns
-    assert "pace" in route.data.columns and "schedule" in route.data.columns
+    assert list(route.schedule.columns) == ["distance", "pace", "schedule"]
+    assert "pace" not in route.data.columns and "schedule" not in route.data.columns
+    assert "gear" not in route.data.columns
 
 
 def test_calculate_projected_time_schedule_total_time(athlete):
@@ -508,6 +702,92 @@ def test_calculate_projected_time_schedule_total_time(athlete):
     assert default_total_time > athlete_total_time
 
 
+def test_calculate_projected_time_schedule_simplified(athlete):
+    route = RouteFactory()
+
+    route.calculate_projected_time_schedule(athlete.user, max_error=None)
+    total_time = route.get_data(1, "schedule")
+
+    route.calculate_projected_time_schedule(athlete.user, max_error=10)
+    assert abs(route.get_data(1, "schedule") - total_time) <= 10
+    assert route.schedule.schedule.is_monotonic_increasing
+    assert len(route.schedule) < len(route.geom)
+
+
+def test_calculate_projected_time_schedule_gradient_tolerance(athlete):
+    route = RouteFactory()
+    route.calculate_projected_time_schedule(athlete.user, max_error=None)
+    total_time = route.get_data(1, "schedule")
+    route.schedules.all().delete()
+
+    route.calculate_projected_time_schedule(
+        athlete.user, max_error=None, gradient_tolerance=0.1
+    )
+    assert route.get_data(1, "schedule") == pytest.approx(total_time, rel=0.01)
+    assert not route.schedules.exists()
+
+
+def test_calculate_projected_time_schedule_saved(athlete, mocker):
+    route = RouteFactory()
+    route.calculate_projected_time_schedule(athlete.user)
+    total_time = route.get_data(1, "schedule")
+    assert route.schedules.count() == 1
+
+    predict = mocker.patch.object(PredictionModel, "predict_numerical")
+    route = Route.objects.get(pk=route.pk)
+    route.calculate_projected_time_schedule(athlete.user)
+
+    predict.assert_not_called()
+    assert route.get_data(1, "schedule") == pytest.approx(total_time)
+
+
+def test_calculate_projected_time_schedule_saved_options(athlete, mocker):
+    route = RouteFactory()
+    ActivityPerformanceFactory(
+        athlete=athlete,
+        activity_type=route.activity_type,
+        gear_categories=array(["None", "g1"]),
+        workout_type_categories=array(["None", "race"]),
+        regression_coefficients=array(
+            [0.0, 0.1, 0.0, 0.2, 0.0, 0.075, 0.0004, 0.0001, 0.0001]
+        ),
+    )
+    route.calculate_projected_time_schedule(athlete.user)
+    schedule = route.schedule.copy()
+
+    predict = mocker.patch.object(PredictionModel, "predict_numerical")
+    route.calculate_projected_time_schedule(
+        athlete.user, gear="g1", workout_type="race"
+    )
+
+    predict.assert_not_called()
+    assert route.schedules.count() == 1
+    assert_series_equal(route.schedule.pace, schedule.pace + 0.3)
+    distance = schedule.distance - schedule.distance[0]
+    assert_series_equal(route.schedule.schedule, schedule.schedule + 0.3 * distance)
+
+
+def test_saved_schedules_deleted(athlete):
+    route = RouteFactory()
+    activity_performance = ActivityPerformanceFactory(
+        athlete=athlete, activity_type=route.activity_type
+    )
+    route.calculate_projected_time_schedule(athlete.user)
+    assert activity_performance.route_schedules.count() == 1
+
+    # retraining the prediction model
+    ActivityFactory(athlete=athlete, activity_type=route.activity_type)
+    activity_performance.train_prediction_model()
+    assert not route.schedules.exists()
+
+    # editing the route
+    route.calculate_projected_time_schedule(athlete.user)
+    route.save(update_fields=["name"])
+    assert route.schedules.exists()
+    route.save()
+    assert not route.schedules.exists()
+
+
 ############################
 # template tag duration.py #
 ############################
@@ -861,6 +1141,137 @@ def test_post_route_delete_not_owner(athlete, client):
     assert response.status_code == 403
 
 
+########################
+# view routes:schedule #
+########################
+
+
+def test_get_route_schedule(athlete, client):
+    route = create_route_with_checkpoints(number_of_checkpoints=3, athlete=athlete)
+    route.calculate_projected_time_schedule(athlete.user)
+    url = route.get_absolute_url("schedule")
+
+    response = client.get(url)
+    assert response.status_code == 200
+
+    schedule = response.json()
+    assert schedule["activity_type"] == route.activity_type.name
+    total_duration = route.get_total_duration()
+    assert schedule["total_duration"] == {
+        "seconds": total_duration.total_seconds(),
+        "display": nice_repr(total_duration, "hike"),
+    }
+    assert [
+        checkpoint["field_value"] for checkpoint in schedule["checkpoints"]
+    ] == [checkpoint.field_value for checkpoint in route.checkpoint_set.all()]
+    assert [
+        checkpoint["schedule"]["seconds"] for checkpoint in schedule["checkpoints"]
+    ] == [
+        route.get_time_data(checkpoint.line_location, "schedule").total_seconds()
+        for checkpoint in route.checkpoint_set.all()
+    ]
+
+
+def create_route_with_workout_types(athlete, number_of_checkpoints=0):
+    route = create_route_with_checkpoints(number_of_checkpoints, athlete=athlete)
+    ActivityFactory(athlete=athlete, activity_type=route.activity_type)
+    ActivityPerformanceFactory(
+        athlete=athlete,
+        activity_type=route.activity_type,
+        gear_categories=array(["None"]),
+        workout_type_categories=array(["None", "race run"]),
+        regression_coefficients=array([0.0, 0.0, 0.2, 0.0, 0.075, 0.0004, 0.0, 0.0]),
+    )
+    return route
+
+
+def test_get_route_schedule_options(athlete, client):
+    route = create_route_with_workout_types(athlete)
+    url = route.get_absolute_url("schedule")
+    default_schedule = client.get(url).json()
+
+    query = {"activity_type": route.activity_type.name, "workout_type": "race run"}
+    schedule = client.get(url, query).json()
+
+    assert schedule["workout_type"] == "race run"
+    assert (
+        schedule["total_duration"]["seconds"]
+        > default_schedule["total_duration"]["seconds"]
+    )
+
+
+def test_get_route_schedule_not_logged_in(athlete, client):
+    route = RouteFactory()
+    client.logout()
+    response = client.get(route.get_absolute_url("schedule"))
+
+    assert response.status_code == 200
+    assert response.json()["total_duration"]["seconds"] > 0
+
+
+def test_get_route_schedule_saved(athlete, client, mocker):
+    query_counts = []
+    for number_of_checkpoints in [2, 20]:
+        route = create_route_with_workout_types(athlete, number_of_checkpoints)
+        url = route.get_absolute_url("schedule")
+
+        # the first request saves the schedule of the route
+        client.get(url)
+
+        predict = mocker.patch.object(PredictionModel, "predict_numerical")
+        load_data = mocker.patch.object(Route, "load_data_arrays")
+        query = {"activity_type": route.activity_type.name, "workout_type": "race run"}
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(url, query)
+        mocker.stopall()
+
+        # the saved schedule is used without reading the route data
+        assert response.status_code == 200
+        assert len(response.json()["checkpoints"]) == number_of_checkpoints
+        predict.assert_not_called()
+        load_data.assert_not_called()
+        query_counts.append(len(queries))
+
+    # checkpoints are read in a single query
+    assert query_counts[0] == query_counts[1]
+
+
+def test_get_route_schedule_format(athlete, client):
+    route = RouteFactory(athlete=athlete)
+    url = route.get_absolute_url("schedule")
+
+    for display_format, expected_format in [
+        ("long", "long"),
+        ("hike", "hike"),
+        ("spam", "hike"),
+    ]:
+        schedule = client.get(url, {"format": display_format}).json()
+        total_duration = timedelta(seconds=schedule["total_duration"]["seconds"])
+        assert schedule["total_duration"]["display"] == nice_repr(
+            total_duration, expected_format
+        )
+
+
+@benchmark
+def test_get_route_schedule_latency(athlete, client):
+    route = create_route_with_workout_types(athlete, number_of_checkpoints=20)
+    url = route.get_absolute_url("schedule")
+
+    # the first request saves the schedule of the route
+    client.get(url)
+
+    durations = []
+    for workout_type in ["None", "race run"] * 10:
+        query = {"activity_type": route.activity_type.name}
+        query["workout_type"] = workout_type
+        start = perf_counter()
+        response = client.get(url, query)
+        durations.append(perf_counter() - start)
+        assert response.status_code == 200
+
+    assert percentile(durations, 95) < SCHEDULE_LATENCY_BUDGET
+
+
 ################################
 # view routes:checkpoints_list #
 ################################
@@ -949,7 +1360,7 @@ def test_cleanup_hdf5_files_missing_route_file():
     data_dir = Path(full_path).parent.resolve()
 
     # delete one route file
-    file_to_delete = list(data_dir.glob("*"))[0]
+    file_to_delete = list(data_dir.glob("*.h5"))[0]
     (data_dir / file_to_delete).unlink()
 
     # add one random file
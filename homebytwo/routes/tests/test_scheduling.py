@@ -0,0 +1,61 @@
+from django.contrib.auth.models import AnonymousUser
+
+from numpy import array
+
+from ...utils.tests import create_route_with_checkpoints
+from ..scheduling import batch_schedule
+from .factories import ActivityTypeFactory, RouteFactory
+
+
+def test_batch_schedule(athlete):
+    routes = [
+        create_route_with_checkpoints(number_of_checkpoints=3, athlete=athlete),
+        RouteFactory(athlete=athlete),
+    ]
+    for route in routes:
+        route.update_permanent_track_data()
+
+    activity_types = [
+        ActivityTypeFactory(name="Run"),
+        ActivityTypeFactory(
+            name="Hike",
+            flat_parameter=0.5,
+            workout_type_categories=array(["None", "race"]),
+            regression_coefficients=array([0.0, 0.1, 0.0, 0.075, 0.0004, 0.0, 0.0]),
+        ),
+    ]
+
+    schedules = batch_schedule(routes, activity_types, workout_type="race")
+    assert [(schedule.route, schedule.predicted_model) for schedule in schedules] == [
+        (route, activity_type) for route in routes for activity_type in activity_types
+    ]
+    assert len(schedules[0].checkpoint_schedules) == 3
+    assert not schedules[-1].checkpoint_schedules
+
+    # same schedule as a route displayed with each activity type
+    for schedule in schedules:
+        route = schedule.route
+        route.activity_type = schedule.predicted_model
+        route.calculate_projected_time_schedule(AnonymousUser(), workout_type="race")
+
+        total_duration = route.get_total_duration()
+        assert abs((schedule.total_duration - total_duration).total_seconds()) <= 30
+        for checkpoint, checkpoint_schedule in schedule.checkpoint_schedules:
+            checkpoint_time = route.get_time_data(checkpoint.line_location, "schedule")
+            assert abs((checkpoint_schedule - checkpoint_time).total_seconds()) <= 30
+
+
+def test_batch_schedule_no_routes():
+    assert batch_schedule([], [ActivityTypeFactory.build()]) == []
+
+
+def test_batch_schedule_stale_route(athlete, mocker, caplog):
+    stale_route = RouteFactory(athlete=athlete)
+    route = RouteFactory(athlete=athlete)
+    route.update_permanent_track_data()
+    mock_save = mocker.patch("homebytwo.routes.models.Route.save")
+
+    schedules = batch_schedule([stale_route, route], [ActivityTypeFactory()])
+    assert [schedule.route for schedule in schedules] == [route]
+    assert f"stale track data: {stale_route.pk}" in caplog.text
+    mock_save.assert_not_called()
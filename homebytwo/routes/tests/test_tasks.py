@@ -1,17 +1,20 @@
 from datetime import timedelta
 
 from homebytwo.conftest import STRAVA_API_BASE_URL
-from homebytwo.routes.models import WebhookTransaction
+from homebytwo.routes.models import ActivityPerformance, WebhookTransaction
 from homebytwo.routes.tasks import (
     import_strava_activities_streams_task,
     import_strava_activities_task,
     import_strava_activity_streams_task,
     process_strava_events,
+    save_route_schedules_task,
     train_prediction_models_task,
 )
 from homebytwo.routes.tests.factories import (
     ActivityFactory,
+    ActivityPerformanceFactory,
     ActivityTypeFactory,
+    RouteFactory,
     WebhookTransactionFactory,
 )
 
@@ -158,6 +161,55 @@ def test_train_prediction_models_task_no_activity(athlete):
     assert expected in response
 
 
+def test_train_prediction_models_task_route_schedules(athlete, mocker):
+    activity_type = ActivityTypeFactory(name="Run")
+    ActivityFactory(athlete=athlete, activity_type=activity_type)
+    routes = RouteFactory.create_batch(3, athlete=athlete, activity_type=activity_type)
+    RouteFactory(athlete=athlete, activity_type=ActivityTypeFactory(name="Hike"))
+
+    mocker.patch("homebytwo.routes.tasks.ROUTE_SCHEDULES_CHUNK_SIZE", 2)
+    mock_group = mocker.patch("homebytwo.routes.tasks.group")
+    train_prediction_models_task(athlete.id)
+
+    tasks = mock_group.call_args[0][0]
+    assert [len(task.args[0]) for task in tasks] == [2, 1]
+    assert sorted(sum((task.args[0] for task in tasks), [])) == sorted(
+        route.id for route in routes
+    )
+
+
+def test_train_prediction_models_task_route_schedules_not_trained(athlete, mocker):
+    activity_type = ActivityTypeFactory(name="Run")
+    ActivityFactory(athlete=athlete, activity_type=activity_type)
+    RouteFactory(athlete=athlete, activity_type=activity_type)
+
+    mock_group = mocker.patch("homebytwo.routes.tasks.group")
+    mocker.patch.object(
+        ActivityPerformance,
+        "train_prediction_model",
+        return_value="No training data found for activity type: Run",
+    )
+    train_prediction_models_task(athlete.id)
+    mock_group.assert_not_called()
+
+
+def test_train_prediction_models_task_no_routes(athlete, mocker):
+    ActivityFactory(athlete=athlete, activity_type=ActivityTypeFactory(name="Run"))
+
+    mock_group = mocker.patch("homebytwo.routes.tasks.group")
+    train_prediction_models_task(athlete.id)
+    mock_group.assert_not_called()
+
+
+def test_save_route_schedules_task(athlete):
+    route = RouteFactory(athlete=athlete)
+    ActivityPerformanceFactory(athlete=athlete, activity_type=route.activity_type)
+
+    response = save_route_schedules_task([route.id], athlete.id)
+    assert f"Schedules saved for 1 routes of athlete: {athlete}." in response
+    assert route.schedules.count() == 1
+
+
 def test_process_strava_events_create_update_delete(athlete, mock_call_json_response):
     activity_strava_id = 1234567890
     WebhookTransactionFactory(
@@ -20,6 +20,8 @@ urlpatterns = [
                     views.route_checkpoints_list,
                     name="checkpoints_list",
                 ),
+                # route schedule as json: routes/5/schedule/
+                path("schedule/", views.route_schedule, name="schedule"),
                 # edit route: /routes/5/edit/
                 path("edit/", views.RouteEdit.as_view(), name="edit"),
                 # update route with remote data: /routes/5/update/
@@ -1,13 +1,36 @@
 from collections import namedtuple
 from itertools import accumulate, chain, islice, tee
 from pathlib import Path
+from struct import pack
 
 from django.contrib.gis.db.models.functions import Distance, LineLocatePoint
+from django.contrib.gis.geos import GEOSGeometry
 from django.contrib.gis.measure import D
 
+from numpy import (
+    append,
+    arange,
+    asarray,
+    clip,
+    concatenate,
+    cumsum,
+    diff,
+    errstate,
+    frombuffer,
+    interp,
+    nan_to_num,
+    ones,
+    searchsorted,
+    zeros,
+)
+
 from .fields import LineSubstring
 from .models import ActivityType, Place
 
+# WKB geometry type of LineStrings and flag of geometries with a Z coordinate
+WKB_LINESTRING = 2
+WKB_Z_FLAG = 0x80000000
+
 # named tuple to handle Urls
 Link = namedtuple("Link", ["url", "text"])
 
@@ -171,3 +194,153 @@ def get_distances(points):
         yield from (p2.distance(p1) for p1, p2 in zip(points[1:], points))
 
     return list(accumulate(get_relative_distances()))
+
+
+def get_gradient_mask(distance, altitude, max_gradient):
+    """
+    return a boolean array selecting the points kept when the points with
+    a gradient in percents beyond `max_gradient` from the previous point are
+    dropped all at once, and the gradients recalculated until none remains.
+
+    Dropping points only changes the gradient of the next kept point:
+    each round only checks the points following the points dropped in the
+    previous round, so that tracks are cleaned in linear time.
+    """
+    distance, altitude = asarray(distance), asarray(altitude)
+    size = len(distance)
+
+    # doubly linked list of the kept points: index -1 and `size`
+    # point to a sentinel at the end of `kept`.
+    kept = ones(size + 1, dtype=bool)
+    previous_points = arange(-1, size - 1)
+    next_points = arange(1, size + 1)
+
+    candidates = arange(1, size)
+    while candidates.size:
+        previous = previous_points[candidates]
+        with errstate(divide="ignore", invalid="ignore"):
+            gradients = (
+                (altitude[candidates] - altitude[previous])
+                / (distance[candidates] - distance[previous])
+                * 100
+            )
+        is_bad = (gradients < -max_gradient) | (gradients > max_gradient)
+        bad_points = candidates[is_bad]
+        kept[bad_points] = False
+
+        # unlink the runs of consecutive bad points
+        run_starts = bad_points[kept[previous_points[bad_points]]]
+        run_ends = bad_points[kept[next_points[bad_points]]]
+        before, after = previous_points[run_starts], next_points[run_ends]
+        next_points[before] = after
+        candidates = after[after < size]
+        previous_points[candidates] = before[after < size]
+
+    return kept[:size]
+
+
+def get_simplified_profile_mask(distance, altitude, max_error):
+    """
+    return a boolean array selecting the points of an elevation profile
+    kept to approximate it with straight segments on (distance, altitude).
+
+    Segments are split in two halves of equal distance until the squared
+    deviations of the step gradients in percents from the segment gradient,
+    weighted by the step distances, sum up to at most their share of `max_error`,
+    in proportion to their length. A pace prediction quadratic in gradient:
+    a + b * gradient + c * gradient ** 2 thus changes by at most |c| * `max_error`
+    seconds over the whole profile.
+
+    Each segment is checked in constant time: smooth profiles are simplified
+    to a few points, whatever their sampling rate.
+    """
+    distance = asarray(distance, dtype=float)
+    altitude = asarray(altitude, dtype=float)
+    size = len(distance)
+
+    if size < 3 or distance[-1] <= distance[0]:
+        return ones(size, dtype=bool)
+
+    steps = diff(distance)
+    with errstate(divide="ignore", invalid="ignore"):
+        gradients = nan_to_num(diff(altitude) / steps * 100, posinf=0, neginf=0)
+
+    # the deviation of a segment is calculated from the cumulative sum
+    # of the squared gradients
+    squared_gradients = concatenate([[0], cumsum(steps * gradients ** 2)])
+    total_distance = distance[-1] - distance[0]
+
+    keep = zeros(size, dtype=bool)
+    keep[[0, -1]] = True
+    starts, ends = asarray([0]), asarray([size - 1])
+
+    # split all the segments exceeding their share of the error at once
+    while starts.size:
+        lengths = distance[ends] - distance[starts]
+        with errstate(divide="ignore", invalid="ignore"):
+            deviations = (
+                squared_gradients[ends]
+                - squared_gradients[starts]
+                - ((altitude[ends] - altitude[starts]) * 100) ** 2 / lengths
+            )
+        is_split = (
+            (ends - starts > 1)
+            & (lengths > 0)
+            & (deviations > max_error * lengths / total_distance)
+        )
+        starts, ends = starts[is_split], ends[is_split]
+
+        # split at the inner point closest to the middle of the segment
+        middles = (distance[starts] + distance[ends]) / 2
+        splits = clip(searchsorted(distance, middles), starts + 1, ends - 1)
+
+        keep[splits] = True
+        starts, ends = concatenate([starts, splits]), concatenate([splits, ends])
+
+    return keep
+
+
+def resample_profile(distance, altitude, step):
+    """
+    return the distances and the interpolated altitudes of an elevation profile
+    resampled every `step` meters, from its first to its last point.
+    """
+    distance = asarray(distance, dtype=float)
+    grid = append(arange(distance[0], distance[-1], step), distance[-1])
+    return grid, interp(grid, distance, asarray(altitude, dtype=float))
+
+
+def get_coordinates(line):
+    """
+    return the coordinates of a LineString as an (n, 2) NumPy array,
+    or (n, 3) with altitudes.
+
+    The coordinates are read at once from the WKB representation of the line,
+    instead of creating a Python object per point.
+    """
+    wkb = bytes(line.wkb)
+    byte_order = "<" if wkb[0] == 1 else ">"
+    dimensions = 3 if line.hasz else 2
+
+    # skip the byte order, the geometry type and the number of points
+    coords = frombuffer(wkb, dtype=f"{byte_order}f8", offset=9)
+    return coords.reshape(-1, dimensions)
+
+
+def create_line(coords, srid=None):
+    """
+    return a LineString from an (n, 2) or (n, 3) array of coordinates,
+    parsed at once by GEOS from its WKB representation.
+
+    :raises ValueError: if there are less than two coordinates, like LineString
+    """
+    coords = asarray(coords, dtype="<f8")
+    if len(coords) < 2:
+        raise ValueError(f"LineString requires at least 2 points, got {len(coords)}.")
+
+    geometry_type = WKB_LINESTRING
+    if coords.shape[1] == 3:
+        geometry_type |= WKB_Z_FLAG
+
+    wkb = pack("<BII", 1, geometry_type, len(coords)) + coords.tobytes()
+    return GEOSGeometry(memoryview(wkb), srid=srid)
@@ -1,5 +1,5 @@
 import json
-from datetime import datetime
+from datetime import datetime, timedelta
 from io import BytesIO
 
 from django.conf import settings
@@ -25,6 +25,7 @@ from ..importers.decorators import remote_connection, strava_required
 from ..importers.exceptions import SwitzerlandMobilityError
 from .forms import ActivityPerformanceForm, RouteForm
 from .models import Activity, ActivityType, Route, WebhookTransaction
+from .models.track import CHECKPOINT_COLUMNS
 from .tasks import (
     import_strava_activities_task,
     import_strava_activity_streams_task,
@@ -32,6 +33,7 @@ from .tasks import (
     train_prediction_models_task,
     upload_route_to_garmin_task,
 )
+from .templatetags.duration import DISPLAY_FORMATS, nice_repr
 
 
 @login_required
@@ -59,43 +61,15 @@ def view_route(request, pk):
     """
     route = get_object_or_404(Route, pk=pk)
 
-    if request.method == "POST":
-        performance_form = ActivityPerformanceForm(
-            route,
-            request.user.athlete if request.user.is_authenticated else None,
-            data=request.POST,
-        )
-
-        if performance_form.is_valid():
-            activity_type_name = performance_form.cleaned_data["activity_type"]
-            workout_type = performance_form.cleaned_data.get("workout_type")
-            gear_id = performance_form.cleaned_data.get("gear")
-            route.activity_type = ActivityType.objects.get(name=activity_type_name)
-
-    # invalid form: the activity type was changed in the form,
-    # we reinitialize the form to get gear and workout type
-    # matching the new activity type
-    if request.method == "GET" or not performance_form.is_valid():
-        # get unbound performance form with initial values
-        performance_form = ActivityPerformanceForm(
-            route,
-            request.user.athlete if request.user.is_authenticated else None,
-            initial={"activity_type": route.activity_type.name},
-        )
-
-        gear_id = (
-            performance_form.fields["gear"].choices[0][0]
-            if "gear" in performance_form.fields
-            else None
-        )
-        workout_type = (
-            performance_form.fields["workout_type"].choices[0][0]
-            if "workout_type" in performance_form.fields
-            else None
-        )
+    data = request.POST if request.method == "POST" else None
+    performance_form, gear_id, workout_type = get_performance_options(
+        request, route, data
+    )
 
-    # restore route data from remote source if data file was corrupted or deleted
-    if route.data is None:
+    # restore route data from remote source if data file was corrupted or deleted.
+    # The data file is only read if it cannot be found, so that saved schedules
+    # are displayed without reading the route data.
+    if route.get_data_version() is None and route.data is None:
         try:
             route.geom, route.data = route.get_route_data(
                 cookies=request.session.get("switzerland_mobility_cookies")
@@ -114,13 +88,16 @@ def view_route(request, pk):
         workout_type=workout_type,
     )
 
-    # retrieve checkpoints along the way
-    checkpoints = route.checkpoint_set.all()
-    checkpoints = checkpoints.select_related("route", "place")
+    # retrieve checkpoints along the way and interpolate their data in one batch
+    checkpoints = route.checkpoint_set.select_related("place__place_type")
+    checkpoints = route.annotate_checkpoints(
+        checkpoints, columns=CHECKPOINT_COLUMNS + ["schedule"]
+    )
 
     # schedule is not a calculated property on Checkpoint: the schedule can change
     for checkpoint in checkpoints:
-        checkpoint.schedule = route.get_time_data(checkpoint.line_location, "schedule")
+        schedule = checkpoint.get_route_data("schedule")
+        checkpoint.schedule = timedelta(seconds=int(schedule))
 
     context = {
         "route": route,
@@ -130,6 +107,104 @@ def view_route(request, pk):
     return render(request, "routes/route/route.html", context)
 
 
+@require_safe
+@permission_required("routes.view_route", fn=objectgetter(Route))
+def route_schedule(request, pk):
+    """
+    return the total duration and the checkpoint schedules of the route as json
+    for the parameters of the ActivityPerformanceForm passed in the query string.
+
+    Only the schedule is calculated, from the schedule saved for the route and
+    the prediction model kept in memory, so that the route page can update it
+    without reloading.
+
+    Durations are displayed in the `format` of the query string, "long" or "hike",
+    by default "hike" as on the route page.
+    """
+    route = get_object_or_404(Route, pk=pk)
+
+    display_format = request.GET.get("format")
+    if display_format not in DISPLAY_FORMATS:
+        display_format = "hike"
+
+    _, gear_id, workout_type = get_performance_options(
+        request, route, request.GET or None
+    )
+
+    if route.get_data_version() is None and route.data is None:
+        raise Http404("Route information could not be found.")
+
+    route.calculate_projected_time_schedule(
+        user=request.user,
+        gear=gear_id,
+        workout_type=workout_type,
+    )
+
+    checkpoints = route.annotate_checkpoints(
+        route.checkpoint_set.all(), columns=["schedule"]
+    )
+
+    return JsonResponse(
+        {
+            "activity_type": route.activity_type.name,
+            "gear": gear_id,
+            "workout_type": workout_type,
+            "total_duration": get_schedule_dict(
+                route.get_data(1, "schedule"), display_format
+            ),
+            "checkpoints": [
+                {
+                    "field_value": checkpoint.field_value,
+                    "schedule": get_schedule_dict(
+                        checkpoint.get_route_data("schedule"), display_format
+                    ),
+                }
+                for checkpoint in checkpoints
+            ],
+        }
+    )
+
+
+def get_schedule_dict(schedule, display_format="hike"):
+    """
+    return a schedule in seconds as json, with its display in the given format
+    """
+    seconds = int(schedule)
+    return {
+        "seconds": seconds,
+        "display": nice_repr(timedelta(seconds=seconds), display_format),
+    }
+
+
+def get_performance_options(request, route, data=None):
+    """
+    return the ActivityPerformanceForm of the route with the gear and workout type
+    to predict the schedule with.
+
+    A valid form sets the activity type of the route. If the form is not valid,
+    e.g. the activity type was changed in the form, the form is reinitialized
+    to get gear and workout type matching the new activity type.
+    """
+    athlete = request.user.athlete if request.user.is_authenticated else None
+
+    if data is not None:
+        performance_form = ActivityPerformanceForm(route, athlete, data=data)
+
+        if performance_form.is_valid():
+            activity_type_name = performance_form.cleaned_data["activity_type"]
+            workout_type = performance_form.cleaned_data.get("workout_type")
+            gear_id = performance_form.cleaned_data.get("gear")
+            route.activity_type = ActivityType.objects.get(name=activity_type_name)
+            return performance_form, gear_id, workout_type
+
+    # get unbound performance form with initial values
+    performance_form = ActivityPerformanceForm(
+        route, athlete, initial={"activity_type": route.activity_type.name}
+    )
+    gear_id, workout_type = performance_form.get_initial_options()
+    return performance_form, gear_id, workout_type
+
+
 @method_decorator(login_required, name="dispatch")
 class RouteEdit(PermissionRequiredMixin, UpdateView):
     """